@@ -0,0 +1,283 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from detector import ICONS_PATH, CardDetector
+from env import SolitaireEnv, console
+from moves import decode_action
+
+
+SCREENSHOT_PATH = os.path.join(os.path.dirname(ICONS_PATH), "screenshot_1.png")
+
+
+def scripted_games(games, steps, seed=0):
+    """
+    Fixed action scripts: for every game, the seed it is dealt from and a line of random
+    legal moves (chosen with a generator seeded by `seed`) played from it, so benchmarks
+    replaying them time only valid moves, the same ones on every run.
+
+    Returns:
+    - list: (seed, actions) per game.
+    """
+    env = SolitaireEnv()
+    rng = np.random.default_rng(seed)
+    scripts = []
+    for game in range(games):
+        env.reset(seed=seed + game)
+        actions = []
+        while len(actions) < steps:
+            legal = np.flatnonzero(env.action_masks())
+            if not len(legal):
+                break
+            action = decode_action(int(rng.choice(legal)))
+            actions.append(action)
+            _, _, done, truncated, _ = env.step(action)
+            if done or truncated:
+                break
+        scripts.append((seed + game, actions))
+    return scripts
+
+
+# Every benchmark runs its operation a fixed number of times and returns
+# (seconds spent in the timed operation, number of operations)
+
+def bench_step_random(config):
+    # Actions sampled from the whole action space, as an unmasked policy would: mostly invalid moves
+    env = SolitaireEnv()
+    env.action_space.seed(config.seed)
+    env.reset(seed=config.seed)
+    actions = [env.action_space.sample().tolist() for _ in range(config.steps)]
+    elapsed = 0.0
+    for action in actions:
+        start = time.perf_counter()
+        _, _, done, truncated, _ = env.step(action)
+        elapsed += time.perf_counter() - start
+        if done or truncated:
+            env.reset()
+    return elapsed, len(actions)
+
+
+def bench_step_scripted(config):
+    env = SolitaireEnv()
+    elapsed, count = 0.0, 0
+    for seed, actions in config.scripts:
+        env.reset(seed=seed)
+        start = time.perf_counter()
+        for action in actions:
+            env.step(action)
+        elapsed += time.perf_counter() - start
+        count += len(actions)
+    return elapsed, count
+
+
+def bench_reset(config):
+    env = SolitaireEnv()
+    start = time.perf_counter()
+    for game in range(config.resets):
+        env.reset(seed=config.seed + game)
+    return time.perf_counter() - start, config.resets
+
+
+def _bench_after_moves(config, operation, **env_kwargs):
+    # Times `operation(env)` after every move of the scripts, i.e. as step() would run it
+    env = SolitaireEnv(**env_kwargs)
+    elapsed, count = 0.0, 0
+    for seed, actions in config.scripts:
+        env.reset(seed=seed)
+        for action in actions:
+            env.play(action)
+            start = time.perf_counter()
+            operation(env)
+            elapsed += time.perf_counter() - start
+        count += len(actions)
+    return elapsed, count
+
+
+def bench_observation(config):
+    return _bench_after_moves(config, SolitaireEnv._get_observation)
+
+
+def bench_observation_compact(config):
+    return _bench_after_moves(config, SolitaireEnv._get_observation, observation_mode="compact")
+
+
+def bench_action_mask(config):
+    return _bench_after_moves(config, SolitaireEnv.action_masks)
+
+
+def bench_render(config):
+    env = SolitaireEnv()
+    elapsed, count = 0.0, 0
+    for seed, actions in config.scripts:
+        env.reset(seed=seed)
+        # After each of the first moves of every game; the output goes to rich's capture buffer
+        for action in actions[:config.renders]:
+            env.play(action)
+            with console.capture():
+                start = time.perf_counter()
+                env.render()
+                elapsed += time.perf_counter() - start
+        count += min(len(actions), config.renders)
+    return elapsed, count
+
+
+def _bench_render_mode(config, mode):
+    return _bench_after_moves(config, lambda env: env.render(mode))
+
+
+def bench_render_ansi(config):
+    return _bench_render_mode(config, "ansi")
+
+
+def bench_render_rgb_array(config):
+    return _bench_render_mode(config, "rgb_array")
+
+
+def bench_detector(config):
+    screenshot = cv2.imread(SCREENSHOT_PATH)
+    detector = CardDetector()
+    detector.detect(screenshot)  # Loads the templates
+    start = time.perf_counter()
+    for _ in range(config.frames):
+        detector.detect(screenshot)
+    return time.perf_counter() - start, config.frames
+
+
+BENCHMARKS = {
+    "step_random": bench_step_random,
+    "step_scripted": bench_step_scripted,
+    "reset": bench_reset,
+    "observation": bench_observation,
+    "observation_compact": bench_observation_compact,
+    "action_mask": bench_action_mask,
+    "render": bench_render,
+    "render_ansi": bench_render_ansi,
+    "render_rgb_array": bench_render_rgb_array,
+    "detector": bench_detector,
+}
+
+
+# Modules whose import cost is measured by --imports: the rules engine and what worker
+# processes load, then the optional integrations
+IMPORT_MODULES = ("env", "vec_env", "solver", "shared_worker", "rendering", "detector", "shared_vec_env")
+
+
+# Run by import_cost() in a new interpreter. Peak memory is read from /proc (VmHWM), as
+# ru_maxrss would include the benchmark process it was started from on Linux.
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+with open("/proc/self/status") as file:
+    peak = next(int(line.split()[1]) for line in file if line.startswith("VmHWM"))
+heavy = [name for name in ("cv2", "rich", "stable_baselines3", "torch") if name in sys.modules]
+print(json.dumps({{"seconds": elapsed, "rss_mb": peak / 1024, "heavy": heavy}}))
+"""
+
+
+def import_cost(module):
+    """
+    Cost of importing `module` in a new interpreter, as a worker process pays it (Linux).
+
+    Returns:
+    - dict: "seconds" to import it, "rss_mb" peak resident memory of the interpreter, and
+      "heavy": which of cv2, rich, stable_baselines3 and torch it loaded.
+    """
+    output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT.format(module=module)], capture_output=True,
+                            text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    return json.loads(output)
+
+
+def run(names, config, repeat=5):
+    """
+    Runs benchmarks, each `repeat` times, keeping the fastest run (the least disturbed by
+    the rest of the machine).
+
+    Returns:
+    - dict: Per benchmark, "seconds" per operation, "per_second" operations per second
+      and "operations" per run.
+    """
+    results = {}
+    for name in names:
+        best = None
+        for _ in range(repeat):
+            elapsed, count = BENCHMARKS[name](config)
+            if best is None or elapsed / count < best[0] / best[1]:
+                best = (elapsed, count)
+        elapsed, count = best
+        results[name] = {"seconds": elapsed / count, "per_second": count / elapsed, "operations": count}
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Benchmarks slower than in `baseline` (results of an earlier run) by more than a factor
+    `threshold`, as (name, slowdown) pairs.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name in baseline:
+            slowdown = result["seconds"] / baseline[name]["seconds"]
+            if slowdown > threshold:
+                regressions.append((name, slowdown))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the env, observation, mask, render and detector hot paths.")
+    parser.add_argument("benchmarks", nargs="*", help=f"benchmarks to run, of {', '.join(BENCHMARKS)} (all by default)")
+    parser.add_argument("--output", default="benchmark.json", help="where to save the results")
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="fail when a benchmark is slower than the baseline by more than this factor")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--steps", type=int, default=20_000, help="steps of the random policy")
+    parser.add_argument("--games", type=int, default=50, help="games of the scripted policy")
+    parser.add_argument("--game-steps", type=int, default=200, help="moves per scripted game")
+    parser.add_argument("--resets", type=int, default=2_000)
+    parser.add_argument("--renders", type=int, default=5, help="renders per scripted game")
+    parser.add_argument("--frames", type=int, default=20, help="detected screenshots")
+    parser.add_argument("--imports", action="store_true",
+                        help="only measure the import time and memory of the modules, in new interpreters")
+    config = parser.parse_args()
+    if config.imports:
+        for module in IMPORT_MODULES:
+            cost = import_cost(module)
+            print(f"{module:20} {cost['seconds']:8.3f} s {cost['rss_mb']:8.1f} MB  {' '.join(cost['heavy'])}")
+        sys.exit()
+    names = config.benchmarks or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name!r}")
+    config.scripts = scripted_games(config.games, config.game_steps, config.seed)
+
+    results = run(names, config, config.repeat)
+    for name, result in results.items():
+        print(f"{name:20} {result['per_second']:12.1f} /s {result['seconds'] * 1e6:12.2f} us")
+
+    with open(config.output, "w") as file:
+        json.dump({
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "seed": config.seed,
+            "benchmarks": results,
+        }, file, indent=2)
+
+    if config.baseline:
+        with open(config.baseline) as file:
+            baseline = json.load(file)["benchmarks"]
+        regressions = compare(results, baseline, config.threshold)
+        for name, slowdown in regressions:
+            print(f"{name} is {slowdown:.2f}x slower than in {config.baseline}")
+        if regressions:
+            sys.exit(1)
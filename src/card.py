@@ -1,4 +1,8 @@
 class Card:
+    # The environments keep cards as bytes (see the encoding below); Card is only a
+    # lightweight view of one of them for render() and __repr__
+    __slots__ = ("value", "suit", "visible", "bonus")
+
     def __init__(self, value, suit, visible=False, bonus=False):
         """
         Initialize a card with given value, suit, visibility, and bonus status.
@@ -26,3 +30,30 @@ class Card:
         visibility = "Visible" if self.visible else "Hidden"
         return f"Card(value={self.value}, suit={self.suit}, {visibility}, bonus={self.bonus})"
 
+    @classmethod
+    def from_code(cls, code, bonus=False):
+        """Create a Card view of a card byte (card id | VISIBLE_BIT)."""
+        index = code & CARD_ID_MASK
+        return cls(index % 13 + 1, index // 13, visible=bool(code & VISIBLE_BIT), bonus=bonus)
+
+    def to_code(self):
+        """Encode the card as a byte (card id | VISIBLE_BIT)."""
+        return card_id(self.value, self.suit) | (VISIBLE_BIT if self.visible else 0)
+
+
+# Compact integer encoding used by the array-backed environments.
+# The low six bits hold the card id, (value - 1) + suit * 13, which is the same
+# index card_to_one_hot uses for the 52 real cards; bit 6 marks a face-up card.
+CARD_ID_MASK = 0x3F
+VISIBLE_BIT = 0x40
+
+
+def card_id(value, suit):
+    """Return the 0-51 id of the card with the given value (1-13) and suit (0-3)."""
+    return (value - 1) + suit * 13
+
+# Card ids of the compact observation (SolitaireEnv(observation_mode="compact")) for slots
+# without a face-up card, following the 52 real cards: an empty slot (the unexisting suit 4)
+# and a face-down card (the invisible suit 5)
+EMPTY_CARD_ID = 52
+HIDDEN_CARD_ID = 53
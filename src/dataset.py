@@ -0,0 +1,149 @@
+import os
+import queue
+import threading
+
+import numpy as np
+
+from moves import ACTION_SHAPE
+from recorder import RECORD_DTYPE, TABLEAU_BITS, shard_paths, unpack_tableau
+
+
+OBSERVATION_SIZE = TABLEAU_BITS + 4 + 54  # Model input: tableau, foundation and top card one-hots
+# Batch action of a record whose action is outside ACTION_SHAPE (a mistyped move stored
+# before the recorder checked actions); mask these out of the loss
+NO_ACTION = -1
+
+
+class TrajectoryDataset:
+    """
+    Minibatches of transitions recorded by recorder.TrajectoryRecorder, for pretraining.
+
+    The shards are memory-mapped, not loaded, and every batch is decoded with array
+    operations: the gathered records are unpacked into one float32 array of flattened
+    observations (tableau, foundation, top card one-hot, as the pretraining model takes
+    them) and the actions are turned into the flat indices of moves.encode_action.
+    torch.from_numpy turns the arrays into tensors without copying.
+    """
+
+    def __init__(self, paths, batch_size=256, shuffle=True, seed=None, drop_last=False, prefetch=0):
+        """
+        Parameters:
+        - paths (str or list): Shard files, or a directory to read every shard from.
+        - batch_size (int): Transitions per batch.
+        - shuffle (bool): Whether to visit the transitions of all shards in a new random
+          order every epoch (otherwise in recording order).
+        - seed (int): Seed of the shuffling.
+        - drop_last (bool): Whether to skip the last, smaller batch of an epoch.
+        - prefetch (int): Batches decoded ahead by a background thread (0 decodes them in
+          the iterating thread).
+        """
+        if isinstance(paths, str):
+            paths = shard_paths(paths) if os.path.isdir(paths) else [paths]
+        self.shards = []
+        for path in paths:
+            # A shard being written (or cut short by a crash) may end with a partial record
+            count = os.path.getsize(path) // RECORD_DTYPE.itemsize
+            if count:
+                self.shards.append(np.memmap(path, dtype=RECORD_DTYPE, mode="r", shape=(count,)))
+        # offsets[i]: index of the first transition of shard i
+        self.offsets = np.cumsum([0] + [len(shard) for shard in self.shards])
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+        self.drop_last = drop_last
+        self.prefetch = prefetch
+
+    def __len__(self):
+        """Number of transitions."""
+        return int(self.offsets[-1])
+
+    def num_batches(self):
+        """Batches per epoch."""
+        if self.drop_last:
+            return len(self) // self.batch_size
+        return -(-len(self) // self.batch_size)
+
+    def gather(self, indices):
+        """Records of the transitions with the given indices, in that order."""
+        indices = np.asarray(indices)
+        shard_of = np.searchsorted(self.offsets, indices, side="right") - 1
+        records = np.empty(len(indices), dtype=RECORD_DTYPE)
+        for shard in np.unique(shard_of):
+            selected = shard_of == shard
+            records[selected] = self.shards[shard][indices[selected] - self.offsets[shard]]
+        return records
+
+    @staticmethod
+    def decode(records):
+        """
+        Decodes records into a batch.
+
+        Returns:
+        - dict: "state" float32 (n, 6862), "action" int64 (n,) flat action indices (NO_ACTION
+          for actions outside the action space), "reward" float32 (n,) and "done" bool (n,).
+        """
+        n = len(records)
+        state = np.empty((n, OBSERVATION_SIZE), dtype=np.float32)
+        state[:, :TABLEAU_BITS] = unpack_tableau(records["tableau"])
+        state[:, TABLEAU_BITS:TABLEAU_BITS + 4] = records["foundation"]
+        top_card = state[:, TABLEAU_BITS + 4:]
+        top_card[:] = 0
+        top_card[np.arange(n), records["top_card"]] = 1
+        actions = records["action"].astype(np.intp)
+        fits = (actions < ACTION_SHAPE).all(axis=1)
+        action = np.full(n, NO_ACTION, dtype=np.int64)
+        action[fits] = np.ravel_multi_index(actions[fits].T, ACTION_SHAPE)
+        return {
+            "state": state,
+            "action": action,
+            "reward": records["reward"].copy(),
+            "done": records["done"].copy(),
+        }
+
+    def _batches(self):
+        order = self.rng.permutation(len(self)) if self.shuffle else np.arange(len(self))
+        for start in range(0, self.num_batches() * self.batch_size, self.batch_size):
+            indices = order[start:start + self.batch_size]
+            if self.shuffle:
+                # Reading in file order is kinder to the page cache; the batch is still random
+                indices = np.sort(indices)
+            yield self.decode(self.gather(indices))
+
+    def __iter__(self):
+        """One epoch of batches (see decode)."""
+        if not self.prefetch:
+            yield from self._batches()
+            return
+
+        batches = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        end = object()
+
+        def produce():
+            try:
+                for batch in self._batches():
+                    if stop.is_set():
+                        return
+                    batches.put(batch)
+                batches.put(end)
+            except BaseException as error:
+                batches.put(error)
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is end:
+                    break
+                if isinstance(batch, BaseException):
+                    raise batch
+                yield batch
+        finally:
+            # Unblock the producer if the loop was left early
+            stop.set()
+            while thread.is_alive():
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    thread.join(0.01)
@@ -0,0 +1,62 @@
+import numpy as np
+
+
+class DealPool:
+    """
+    A fixed table of shuffled decks, stored as one 52-byte row of card ids per deal in a
+    .npy file that is memory-mapped rather than loaded.
+
+    Deals are addressed by their row number, so the same file gives the same games on every
+    machine, and parallel workers can split it with shard() without coordinating.
+    """
+
+    def __init__(self, path_or_decks, offset=0):
+        """
+        Parameters:
+        - path_or_decks (str or ndarray): Path of a file written by DealPool.generate, or an
+          array of decks of shape (num_deals, 52).
+        - offset (int): Deal number of the first row (used by shard()).
+        """
+        if isinstance(path_or_decks, np.ndarray):
+            self.decks = path_or_decks
+        else:
+            self.decks = np.load(path_or_decks, mmap_mode='r')
+        if self.decks.ndim != 2 or self.decks.shape[1] != 52:
+            raise ValueError(f"Expected decks of shape (num_deals, 52), got {self.decks.shape}")
+        self.offset = offset
+
+    @classmethod
+    def generate(cls, path, num_deals, seed=None, chunk_size=1 << 16):
+        """Write `num_deals` random decks to `path` (a .npy file) and open it as a pool."""
+        rng = np.random.default_rng(seed)
+        decks = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=(num_deals, 52))
+        for start in range(0, num_deals, chunk_size):
+            count = min(chunk_size, num_deals - start)
+            decks[start:start + count] = rng.permuted(np.tile(np.arange(52, dtype=np.uint8), (count, 1)), axis=1)
+        decks.flush()
+        del decks
+        return cls(path)
+
+    def __len__(self):
+        return len(self.decks)
+
+    def __getitem__(self, deal):
+        """Deck of the given deal number (or decks of an array of deal numbers)."""
+        index = np.asarray(deal) - self.offset
+        if np.any(index < 0) or np.any(index >= len(self)):
+            raise IndexError(f"Deal {deal} is outside this pool's deal numbers {self.deal_numbers()}")
+        return self.decks[index]
+
+    def deal_numbers(self):
+        """Range of the deal numbers in this pool."""
+        return range(self.offset, self.offset + len(self))
+
+    def sample(self, rng, size=None):
+        """Random deal number(s) from this pool."""
+        return self.offset + rng.integers(len(self), size=size)
+
+    def shard(self, index, count):
+        """The `index`-th of `count` contiguous, nearly equal parts of the pool (no copy)."""
+        start = len(self) * index // count
+        stop = len(self) * (index + 1) // count
+        return DealPool(self.decks[start:stop], offset=self.offset + start)
@@ -0,0 +1,255 @@
+import functools
+import os
+
+import cv2
+import numpy as np
+
+from card import EMPTY_CARD_ID, HIDDEN_CARD_ID, card_id
+from state import NUM_COLUMNS, OBS_ROWS
+
+
+# Screen layout of the game (in screenshot pixels), as in obtain_visible_cards_from_screenshot:
+# the tableau's top-left corner, the distance between columns and between stacked cards
+BASELINE_X, BASELINE_Y = 727, 291
+OFFSET_X, OFFSET_Y = 67, 24
+TOP_ROW_Y = BASELINE_Y - 129  # Top of the foundation and draw pile cards
+# Position of the rank and suit icons relative to the top-left corner of a card, and the
+# margins around them searched for a match. Cards are stacked slightly closer than OFFSET_Y:
+# the icons are 6 pixels below the top of the first card of a column but 3 pixels above it
+# by row 17, so ICON_DY is the middle of that range and the vertical margin is larger (it
+# stays small enough that no window holds the icons of two rows).
+RANK_DX, SUIT_DX, ICON_DY = 6, 44, 2
+MARGIN_X, MARGIN_Y = 3, 7
+# Share of white pixels (above WHITE) around the rank icon of a card's face
+WHITE, FACE_SHARE = 200, 0.4
+# Difference in gray level above which a pixel counts as changed between frames
+PIXEL_CHANGE = 24
+
+ICONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "icons")
+
+
+@functools.lru_cache(maxsize=None)
+def load_templates(icons_path=ICONS_PATH):
+    """
+    Rank and suit templates of an icons directory, loaded once per path.
+
+    Returns:
+    - tuple: (ranks, suits), each a list of (label, template): ranks 1-13 as grayscale
+      images from icons/ranks, suits 0-3 as BGR images from icons/suits.
+    """
+    def load(directory, flags):
+        templates = []
+        for name in os.listdir(directory):
+            template = cv2.imread(os.path.join(directory, name), flags)
+            if template is not None:
+                templates.append((int(os.path.splitext(name)[0]), template))
+        return sorted(templates, key=lambda item: item[0])
+
+    return (load(os.path.join(icons_path, "ranks"), cv2.IMREAD_GRAYSCALE),
+            load(os.path.join(icons_path, "suits"), cv2.IMREAD_COLOR))
+
+
+def match_templates(image, templates, threshold=0.9):
+    """
+    Best matches of templates in an image, with non-maximum suppression: every position
+    keeps its best-matching template, then matches are taken from the best score down,
+    skipping those overlapping an already taken match.
+
+    Parameters:
+    - image (ndarray): Image to search (grayscale or BGR, like the templates).
+    - templates (list): (label, template) pairs.
+    - threshold (float): Minimum normalized correlation of a match.
+
+    Returns:
+    - list: (label, x, y, score) tuples, (x, y) being the top-left corner of the match.
+    """
+    height, width = image.shape[:2]
+    scores = np.full((len(templates), height, width), -1, dtype=np.float32)
+    for index, (_, template) in enumerate(templates):
+        if template.shape[0] <= height and template.shape[1] <= width:
+            result = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+            scores[index, :result.shape[0], :result.shape[1]] = result
+    best = scores.max(axis=0)
+    ys, xs = np.nonzero(best >= threshold)
+    if not len(ys):
+        return []
+    labels = scores[:, ys, xs].argmax(axis=0)
+
+    matches = []
+    taken = np.zeros((height, width), dtype=bool)
+    for i in np.argsort(-best[ys, xs], kind="stable"):
+        y, x = ys[i], xs[i]
+        if taken[y, x]:
+            continue
+        label, template = templates[labels[i]]
+        template_height, template_width = template.shape[:2]
+        taken[max(y - template_height + 1, 0):y + template_height, max(x - template_width + 1, 0):x + template_width] = True
+        matches.append((label, int(x), int(y), float(best[y, x])))
+    return matches
+
+
+class CardDetector:
+    """
+    Reads the visible cards of the game from screenshots by template matching.
+
+    Instead of matching every template over the whole screenshot, only the slots where a
+    rank or suit icon can be are searched: the icon positions of every tableau row and
+    foundation, with a small margin, taken from the layout constants above. The slots
+    showing the top of a face-up card (mostly white around the rank icon) are cut out and
+    put side by side into one image, so every template is matched with a single
+    matchTemplate call, and every slot keeps its best match. The fanned draw pile cards
+    are matched in their band with non-maximum suppression (match_templates).
+    Templates are loaded once (load_templates).
+    """
+
+    def __init__(self, icons_path=ICONS_PATH, threshold=0.9):
+        self.ranks, self.suits = load_templates(icons_path)
+        self.threshold = threshold
+        self.window_height = max(template.shape[0] for _, template in self.ranks + self.suits) + 2 * MARGIN_Y
+        self.window_width = max(template.shape[1] for _, template in self.ranks + self.suits) + 2 * MARGIN_X
+
+        # Top-left corners of the cards of every slot: tableau rows, then foundations
+        columns, rows = np.meshgrid(np.arange(NUM_COLUMNS), np.arange(OBS_ROWS), indexing="ij")
+        left = np.concatenate([BASELINE_X + columns.reshape(-1) * OFFSET_X, BASELINE_X + np.arange(4) * OFFSET_X])
+        top = np.concatenate([BASELINE_Y + rows.reshape(-1) * OFFSET_Y, np.full(4, TOP_ROW_Y)])
+        # Pixel coordinates of the rank and suit search windows of every slot, shaped for
+        # gathering all windows with one indexing operation
+        window_ys = (top + ICON_DY - MARGIN_Y)[:, None, None] + np.arange(self.window_height)[None, :, None]
+        window_xs = (left - MARGIN_X)[:, None, None] + np.arange(self.window_width)[None, None, :]
+        self._window_ys = window_ys
+        self._rank_xs = window_xs + RANK_DX
+        self._suit_xs = window_xs + SUIT_DX
+        # Band of the revealed draw pile cards (columns 4-6 of the top row)
+        self._draw_pile_band = (
+            slice(TOP_ROW_Y + ICON_DY - MARGIN_Y, TOP_ROW_Y + ICON_DY - MARGIN_Y + self.window_height),
+            slice(BASELINE_X + 4 * OFFSET_X, BASELINE_X + NUM_COLUMNS * OFFSET_X),
+        )
+
+    def detect(self, image):
+        """
+        Detects the cards of a screenshot.
+
+        Parameters:
+        - image (ndarray or str): BGR screenshot, or the path of one.
+
+        Returns:
+        - dict: The visible game in the layout of SolitaireEnv(observation_mode="compact"):
+          "tableau" (7 * 18 card ids, face-down cards as HIDDEN_CARD_ID, empty slots as
+          EMPTY_CARD_ID), "foundation" (height per suit) and "top_card" (id of the top
+          revealed card, EMPTY_CARD_ID if none).
+        """
+        if isinstance(image, str):
+            image = cv2.imread(image)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return self.observation(self.detect_slots(image, gray), self.detect_top_card(image, gray))
+
+    @staticmethod
+    def observation(cards, top_card):
+        """The observation of detect() from the cards of all slots (detect_slots) and the top card."""
+        tableau = cards[:NUM_COLUMNS * OBS_ROWS].reshape(NUM_COLUMNS, OBS_ROWS).copy()
+        for column in tableau:
+            visible = np.flatnonzero(column != EMPTY_CARD_ID)
+            if len(visible):
+                # Everything under the top card that isn't face-up is face-down
+                face_down = column[:visible[-1]] == EMPTY_CARD_ID
+                column[:visible[-1]][face_down] = HIDDEN_CARD_ID
+
+        foundation = np.zeros(4, dtype=np.uint8)
+        for card in cards[NUM_COLUMNS * OBS_ROWS:]:
+            if card != EMPTY_CARD_ID:
+                foundation[card // 13] = card % 13 + 1
+
+        return {
+            "tableau": tableau.reshape(-1),
+            "foundation": foundation,
+            "top_card": np.array([top_card], dtype=np.uint8),
+        }
+
+    def changed_slots(self, gray, previous_gray, min_changed=20):
+        """
+        Slots (numbered as in detect_slots) whose icon windows differ between two grayscale
+        frames in at least `min_changed` pixels, and whether the draw pile band changed.
+        """
+        changed = cv2.absdiff(gray, previous_gray) > PIXEL_CHANGE
+        slots = np.flatnonzero(changed[self._window_ys, self._rank_xs].sum(axis=(1, 2))
+                               + changed[self._window_ys, self._suit_xs].sum(axis=(1, 2)) >= min_changed)
+        return slots, int(changed[self._draw_pile_band].sum()) >= min_changed
+
+    def detect_slots(self, image, gray, slots=None):
+        """
+        Card ids of the face-up cards whose top is in the given slots (EMPTY_CARD_ID where
+        there is none). Slots are numbered column * OBS_ROWS + row for the tableau, followed
+        by the four foundations; all slots when `slots` is None.
+        """
+        ys, rank_xs, suit_xs = self._window_ys, self._rank_xs, self._suit_xs
+        if slots is not None:
+            ys, rank_xs, suit_xs = ys[slots], rank_xs[slots], suit_xs[slots]
+        cards = np.full(len(ys), EMPTY_CARD_ID, dtype=np.uint8)
+
+        rank_windows = gray[ys, rank_xs]
+        faces = np.flatnonzero((rank_windows > WHITE).mean(axis=(1, 2)) > FACE_SHARE)
+        if not len(faces):
+            return cards
+        ranks, rank_scores = self._match_windows(rank_windows[faces], self.ranks)
+        suits, suit_scores = self._match_windows(image[ys[faces], suit_xs[faces]], self.suits)
+        found = (rank_scores >= self.threshold) & (suit_scores >= self.threshold)
+        cards[faces[found]] = (ranks[found] - 1) + suits[found] * 13
+        return cards
+
+    @staticmethod
+    def _match_windows(windows, templates):
+        # Best template (label and score) of every window, matching each template once over
+        # the windows laid side by side
+        count, height, width = windows.shape[:3]
+        mosaic = np.ascontiguousarray(np.swapaxes(windows, 0, 1).reshape((height, count * width) + windows.shape[3:]))
+        scores = np.empty((len(templates), count), dtype=np.float32)
+        for index, (_, template) in enumerate(templates):
+            template_height, template_width = template.shape[:2]
+            result = cv2.matchTemplate(mosaic, template, cv2.TM_CCOEFF_NORMED)
+            # Only positions where the template lies within one window count
+            result = np.pad(result, ((0, 0), (0, template_width - 1)), constant_values=-1)
+            result = result.reshape(height - template_height + 1, count, width)[:, :, :width - template_width + 1]
+            scores[index] = result.max(axis=(0, 2))
+        best = scores.argmax(axis=0)
+        labels = np.array([label for label, _ in templates])
+        return labels[best], scores[best, np.arange(count)]
+
+    def detect_top_card(self, image, gray):
+        """Id of the top revealed draw pile card (the rightmost one), EMPTY_CARD_ID if none."""
+        rows, columns = self._draw_pile_band
+        ranks = match_templates(gray[rows, columns], self.ranks, self.threshold)
+        if not ranks:
+            return EMPTY_CARD_ID
+        rank, x, _, _ = max(ranks, key=lambda match: match[1])
+        suit_columns = slice(columns.start + x, columns.start + x + SUIT_DX - RANK_DX + self.window_width)
+        suits = match_templates(image[rows, suit_columns], self.suits, self.threshold)
+        if not suits:
+            return EMPTY_CARD_ID
+        return card_id(rank, min(suits, key=lambda match: match[1])[0])
+
+
+if __name__ == "__main__":
+    import time
+
+    path = os.path.join(os.path.dirname(ICONS_PATH), "screenshot_1.png")
+    screenshot = cv2.imread(path)
+    detector = CardDetector()
+
+    # The notebook's obtain_visible_cards_from_screenshot matches every template over the
+    # whole screenshot and keeps every position above the threshold
+    start = time.perf_counter()
+    gray_screenshot = cv2.cvtColor(screenshot, cv2.COLOR_BGR2GRAY)
+    for templates, searched in ((detector.ranks, gray_screenshot), (detector.suits, screenshot)):
+        for _, template in templates:
+            np.where(cv2.matchTemplate(searched, template, cv2.TM_CCOEFF_NORMED) >= 0.9)
+    full_time = time.perf_counter() - start
+
+    runs = 20
+    start = time.perf_counter()
+    for _ in range(runs):
+        detected = detector.detect(screenshot)
+    detect_time = (time.perf_counter() - start) / runs
+
+    print(f"Full-screenshot matching: {full_time * 1000:.1f} ms, CardDetector.detect: {detect_time * 1000:.1f} ms")
+    print("Tableau:\n", detected["tableau"].reshape(NUM_COLUMNS, OBS_ROWS))
+    print("Foundation:", detected["foundation"], "Top card:", detected["top_card"])
@@ -1,18 +1,36 @@
-from stable_baselines3.common.env_checker import check_env
-from stable_baselines3 import PPO, A2C, DQN
+# The rules engine needs only numpy and gymnasium: rich (render_mode "human") and cv2
+# (rendering.py, for "rgb_array") are imported on first use, so processes that only play
+# games (vec env workers, solvers) start without them.
 import gymnasium as gym
 from gymnasium import spaces
-import random
-from rich.console import Console
-from rich.text import Text
 import numpy as np
-import cv2
-import os
-from card import Card
+import time
+from card import Card, CARD_ID_MASK, EMPTY_CARD_ID, HIDDEN_CARD_ID, VISIBLE_BIT
+from moves import NUM_ACTIONS, decode_action, legal_move_indices
+from state import (
+    CAN_STACK, CARD_SUITS, CARD_VALUES, COLUMN_CAPACITY, DRAW_PILE, DRAW_PILE_CYCLES, DRAW_PILE_LEN,
+    FOUNDATION, LENGTHS, MAX_TRIES, NUM_COLUMNS, OBS_ROWS, REVEALED, REVEALED_LEN, STATE_SIZE, STOCK_CAPACITY,
+    TABLEAU,
+    deal, position_hash,
+)
+from stats import PHASES, StepStats
 
 
-# Initialize a Console object from the rich library for printing with styles
-console = Console()
+ENV_ID = "Solitaire-v0"
+
+_console = None
+
+
+def __getattr__(name):
+    # `console`: the rich Console render("human") prints to, created on first use
+    global _console
+    if name == "console":
+        if _console is None:
+            from rich.console import Console
+            _console = Console()
+        return _console
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 def card_to_one_hot(card):
     """
@@ -27,28 +45,96 @@ def card_to_one_hot(card):
     return one_hot
 
 class SolitaireEnv(gym.Env):
-    def __init__(self):
+    metadata = {"render_modes": ["human", "ansi", "rgb_array"], "render_fps": 4}
+
+    def __init__(self, copy_observations=True, deal_pool=None, observation_mode="one_hot", draw_pile_observation=False,
+                 collect_stats=False, render_mode=None, keep_history=False):
+        """
+        Parameters:
+        - copy_observations (bool): Whether reset() and step() return copies of the observation
+          arrays. When False they return read-only views of the env's observation buffers, which
+          are updated in place by the next step.
+        - deal_pool (DealPool): Optional table of precomputed decks (see deals.py). When given,
+          every game is dealt from it instead of shuffling a new deck.
+        - observation_mode (str): "one_hot" for the one-hot tableau and top card, or "compact"
+          for card ids: the tableau as 7x18 ids (0-51 for face-up cards, HIDDEN_CARD_ID for
+          face-down cards and EMPTY_CARD_ID for empty slots, flattened) and the top card as
+          the id of the last revealed card (EMPTY_CARD_ID if none).
+        - draw_pile_observation (bool): Whether the compact observation also has "draw_pile":
+          the number of cards in the draw pile, of revealed cards, and the draw pile cycles left.
+        - collect_stats (bool): Whether to time the phases of every step and count their
+          outcomes (see stats.py), returned per step in the info of step() and in total by
+          get_stats(). Off, it costs a few attribute checks per step.
+        - render_mode (str): What render() does: "human" prints the game with rich (also
+          the default when None), "ansi" returns it as text and "rgb_array" as an RGB image
+          (see rendering.py).
+        - keep_history (bool): Whether to record every step as a delta (the bytes it changed),
+          for undo() and redo(); about 500 bytes per step kept until the next reset. Off,
+          undo() has nothing to revert: use snapshot() and restore() to branch instead.
+        """
+        if observation_mode not in ("one_hot", "compact"):
+            raise ValueError(f"Unknown observation_mode {observation_mode!r}")
+        if draw_pile_observation and observation_mode != "compact":
+            raise ValueError("draw_pile_observation requires observation_mode='compact'")
+        if render_mode is not None and render_mode not in self.metadata["render_modes"]:
+            raise ValueError(f"Unknown render_mode {render_mode!r}")
+        self.render_mode = render_mode
         super(SolitaireEnv, self).__init__()
-        self.tries = 400
+        self.tries = MAX_TRIES
         # The action space now includes three parts: action type, source column, destination column
         # Action type: 0 (Move within tableau), 1 (Draw card), 2 (Move to foundation); Source column (0-11) and card index (0-18); Destination column (0-6)
         self.action_space = spaces.MultiDiscrete([3, 12, 18, 7])
 
         # Define observation space with structured tableau, foundation, and draw pile
-        self.observation_space = spaces.Dict({
-            'tableau': spaces.MultiDiscrete([2] * 54 * 7 * 18),  # Each card is one-hot (54), 7 columns, 18 cards max
-            'foundation': spaces.MultiDiscrete([14, 14, 14, 14]),  # Foundation unchanged
-            'top_card': spaces.MultiDiscrete([2] * 54),  # One-hot encoded top card
-        })
-
-        # Track revealed cards from the draw pile
-        self.revealed_cards = []
-        self.draw_index = 0  # Tracks current position in draw pile
-
-        self.tableau = None
-        self.foundation = None
-        self.draw_pile = None
-        self.draw_pile_cycles = 3
+        self.observation_mode = observation_mode
+        self.draw_pile_observation = draw_pile_observation
+        if observation_mode == "compact":
+            observation_space = {
+                'tableau': spaces.MultiDiscrete([54] * 7 * OBS_ROWS),  # Card id per slot, 7 columns, 18 cards max
+                'foundation': spaces.MultiDiscrete([14, 14, 14, 14]),
+                'top_card': spaces.MultiDiscrete([53]),  # Card id or EMPTY_CARD_ID
+            }
+            if draw_pile_observation:
+                observation_space['draw_pile'] = spaces.MultiDiscrete(
+                    [STOCK_CAPACITY + 1, STOCK_CAPACITY + 1, DRAW_PILE_CYCLES + 1])
+            self.observation_space = spaces.Dict(observation_space)
+        else:
+            self.observation_space = spaces.Dict({
+                'tableau': spaces.MultiDiscrete([2] * 54 * 7 * OBS_ROWS),  # Each card is one-hot (54), 7 columns, 18 cards max
+                'foundation': spaces.MultiDiscrete([14, 14, 14, 14]),  # Foundation unchanged
+                'top_card': spaces.MultiDiscrete([2] * 54),  # One-hot encoded top card
+            })
+
+        # Whole game state in one uint8 buffer (layout in state.py), so copying a
+        # state is a single buffer copy
+        self._bind_state(np.zeros(STATE_SIZE, dtype=np.uint8))
+        # Observation buffers, only re-encoded where the last moves changed something.
+        # They hold uint8 values; the spaces above keep the default int64 dtype because SB3
+        # sums MultiDiscrete nvec in the space dtype, which overflows for uint8
+        self.copy_observations = copy_observations
+        self.deal_pool = deal_pool
+        self.deal = None  # Deal number in deal_pool of the current game
+        self.deck = None  # Shuffled deck (card ids) the current game was dealt from
+        if observation_mode == "compact":
+            self._obs_tableau = np.zeros((NUM_COLUMNS, OBS_ROWS), dtype=np.uint8)
+            self._obs_top_card = np.zeros(1, dtype=np.uint8)
+        else:
+            self._obs_tableau = np.zeros((NUM_COLUMNS, OBS_ROWS, 54), dtype=np.uint8)
+            self._obs_top_card = np.zeros(54, dtype=np.uint8)
+        self._obs_draw_pile = np.zeros(3, dtype=np.uint8)
+        self._bind_observation()
+        # Exact action mask, regenerated lazily after the state changes
+        self._action_mask = np.zeros(NUM_ACTIONS, dtype=bool)
+        self._legal_indices = []
+        self._mask_stale = True
+        # With keep_history, every step is recorded as a reversible delta for undo()/redo()
+        self.keep_history = keep_history
+        self._history = []
+        self._redo = []
+        self._delta = []
+        self.stats = StepStats() if collect_stats else None
+        self._step_info = {}
+        self.draw_pile_cycles = DRAW_PILE_CYCLES
         self.done = False
         self.reward = 0
         self.colors = {
@@ -65,118 +151,312 @@ class SolitaireEnv(gym.Env):
         self.unexisting_suit = 4
         self._reset_game_state()
 
-    def _reset_game_state(self):
-        # Initialize the deck as a list of Card objects
-        deck = [Card(value, suit) for suit in range(4) for value in range(self.ace_value, self.king_value+1)]
-        random.shuffle(deck)
-
-        # Initialize tableau with some cards face-down
-        self.tableau = [[deck.pop() for _ in range(i + 1)] for i in range(7)]
-        for col in self.tableau:
-            for card in col[:-1]:
-                card.visible = False  # Face-down
-            col[-1].visible = True  # Top card face-up
+    def _bind_state(self, state):
+        # Views into the state buffer used by the game logic
+        self._state = state
+        self._tableau = state[TABLEAU].reshape(NUM_COLUMNS, COLUMN_CAPACITY)
+        self._lengths = state[LENGTHS]
+        self._foundation = state[FOUNDATION]
+        self._draw_pile = state[DRAW_PILE]
+        self._revealed = state[REVEALED]
+
+    def _bind_observation(self):
+        # Read-only views handed out by _get_observation when copy_observations is False
+        self._observation = {
+            "tableau": self._obs_tableau.reshape(-1).view(),
+            "foundation": self._foundation.view(),
+            "top_card": self._obs_top_card.view(),
+        }
+        if self.draw_pile_observation:
+            self._observation["draw_pile"] = self._obs_draw_pile.view()
+        for value in self._observation.values():
+            value.flags.writeable = False
+        # _dirty_from[col]: first row of the column that changed since it was last encoded,
+        # None when the whole observation needs re-encoding
+        self._dirty_from = None
+        self._encoded_lengths = [0] * NUM_COLUMNS
+
+    def __getstate__(self):
+        # Views are rebuilt on unpickling/copying so they keep sharing one buffer
+        attributes = self.__dict__.copy()
+        for name in ("_tableau", "_lengths", "_foundation", "_draw_pile", "_revealed", "_observation"):
+            del attributes[name]
+        return attributes
+
+    def __setstate__(self, attributes):
+        self.__dict__.update(attributes)
+        self._bind_state(self._state)
+        dirty_from, encoded_lengths = self._dirty_from, self._encoded_lengths
+        self._bind_observation()
+        self._dirty_from, self._encoded_lengths = dirty_from, encoded_lengths
+
+    def _reset_game_state(self, deal_number=None, deck=None):
+        if deck is not None:
+            # A given deck (e.g. replaying a logged game) takes precedence over pool and shuffle
+            deck = np.asarray(deck, dtype=np.uint8)
+            if deck.shape != (52,) or not (np.sort(deck) == np.arange(52)).all():
+                raise ValueError("A deck must be a permutation of the 52 card ids")
+        elif self.deal_pool is not None:
+            # Take the deck from the pool instead of shuffling
+            if deal_number is None:
+                deal_number = int(self.deal_pool.sample(self.np_random))
+            deck = self.deal_pool[deal_number]
+        elif deal_number is not None:
+            raise ValueError("Dealing by number requires a deal_pool")
+        else:
+            # Shuffle the deck as card ids (0-51) with the env's seeded generator
+            deck = self.np_random.permutation(52).astype(np.uint8)
+        self.deal = deal_number
+        self.deck = deck
+        deal(self._state, deck)
+        self._dirty_from = None  # The whole observation needs re-encoding
+        self._mask_stale = True
 
-        # Foundation starts empty
-        self.foundation = [[] for _ in range(4)]
-        self.draw_pile = deck  # Remaining cards in the draw pile
         self.done = False
         self.reward = 0
-        self.revealed_cards = []
-        self.draw_index = 0
-
-    def reset(self, seed=None):
-        """Resets the environment to the initial state."""
-        self._reset_game_state()
-        return self._get_observation(), {}
+        self.draw_pile_cycles = DRAW_PILE_CYCLES
+        self.tries = MAX_TRIES
+        self._history = []
+        self._redo = []
+
+    # Card views of the state, for render() and for inspecting the game
+    @property
+    def tableau(self):
+        return [[Card.from_code(code) for code in self._tableau[col, :length]]
+                for col, length in enumerate(self._lengths)]
+
+    @property
+    def foundation(self):
+        return [[Card(value, suit, visible=True, bonus=True) for value in range(self.ace_value, height + 1)]
+                for suit, height in enumerate(self._foundation)]
+
+    @property
+    def draw_pile(self):
+        return [Card.from_code(code) for code in self._draw_pile[:self._state[DRAW_PILE_LEN]]]
+
+    @property
+    def revealed_cards(self):
+        return [Card.from_code(code) for code in self._revealed[:self._state[REVEALED_LEN]]]
+
+    def reset(self, seed=None, options=None):
+        """
+        Resets the environment to a new game.
+
+        Parameters:
+        - seed (int): Seeds the env's random generator, which shuffles the decks (or picks
+          deals from deal_pool), so the same seed gives the same sequence of games.
+        - options (dict): {"deal": n} deals game number n of deal_pool, {"deck": deck} deals
+          the given shuffled deck (52 card ids, as in self.deck).
+        """
+        super().reset(seed=seed)
+        options = options or {}
+        self._reset_game_state(options.get("deal"), options.get("deck"))
+        info = {} if self.deal is None else {"deal": self.deal}
+        return self._get_observation(), info
 
     def is_valid_tableau_move(self, source_col, source_idx):
         """Custom logic to validate moves within tableau based on game rules."""
         # Example logic: check if there's a card at the specified column and index
-        if source_col >= len(self.tableau):
+        if source_col >= NUM_COLUMNS:
             return False
-        if source_idx >= len(self.tableau[source_col]):
+        if source_idx >= self._lengths[source_col]:
             return False
-        if not self.tableau[source_col][source_idx].visible:
+        if not self._tableau[source_col, source_idx] & VISIBLE_BIT:
             return False
         return True
 
     def is_valid_move_to_foundation(self, source_col):
         """Custom logic to validate moves to the foundation."""
         # Example logic: check if a card from the source column can move to the foundation
-        if source_col >= len(self.tableau):
+        if source_col >= NUM_COLUMNS:
             return False
-        if len(self.tableau[source_col]) == 0:
+        if self._lengths[source_col] == 0:
             return False
         return True
 
     def compute_action_mask(self):
-        # Initialize mask with zeros (invalid actions by default)
-        mask = np.zeros((3, 12, 18, 7), dtype=int)
-
-        # Iterate over all possible actions
-        for action_type in range(3):  # Action type: 0, 1, 2
-            for source_col in range(12):  # Source column: 0-11
-                for source_idx in range(18):  # Source index: 0-17
-                    for dest_col in range(7):  # Destination column: 0-6
-                        if action_type == 0:  # Move within tableau
-                            if 0 <= source_col <= 6:
-                                # Check if this source_col and source_idx are valid
-                                if self.is_valid_tableau_move(source_col, source_idx):
-                                    mask[0, source_col, source_idx, dest_col] = 1
-                            elif 7 <= source_col <= 11:
-                                # Ignore source_idx for these columns, but only allow source_idx = 0
-                                if self.is_valid_tableau_move(source_col, 0):
-                                    mask[0, source_col, 0, dest_col] = 1
-
-                        elif action_type == 2:  # Move to foundation
-                            # Only source_col is relevant; ignore source_idx and dest_col
-                            if self.is_valid_move_to_foundation(source_col):
-                                mask[2, source_col, 0, 0] = 1
-
-        mask[1, 0, 0, 0] = 1   # only valid move for drawing card
-
-        return mask.flatten()
+        """Flattened action mask as an int array (see action_masks)."""
+        return self.action_masks().astype(int)
+
+    def action_masks(self):
+        """
+        Exact mask of the legal actions in the current state, flattened in the order of
+        moves.encode_action (the format MaskablePPO expects for a Discrete(4536) action space,
+        see wrappers.FlatActionWrapper). See moves.legal_move_indices for the canonical
+        source_idx/destination of draw pile, foundation and draw actions.
+        """
+        if self._mask_stale:
+            # Only the entries of the previous and the new legal moves are written
+            self._action_mask[self._legal_indices] = False
+            self._legal_indices = legal_move_indices(self._state.tolist())
+            self._action_mask[self._legal_indices] = True
+            self._mask_stale = False
+        return self._action_mask.copy()
+
+    def legal_actions(self):
+        """List of the legal actions ([action_type, source_col, source_idx, destination]) in the current state."""
+        self.action_masks()
+        return [decode_action(index) for index in sorted(self._legal_indices)]
 
 
     def _get_observation(self):
-    # Convert tableau to one-hot encoding
-        tableau_observation = [
-            [card_to_one_hot(card) for card in column]
-            for column in self.tableau
-        ]
+        if self.observation_mode == "compact":
+            return self._get_compact_observation()
+        # Re-encode the tableau slots changed since the last call. Same encoding as
+        # card_to_one_hot: face-up cards at index 53, face-down cards at their id
+        if self._dirty_from is None:
+            # New deal: encode everything at once
+            self._obs_tableau[:] = 0
+            columns, rows = np.nonzero(np.arange(OBS_ROWS) < self._lengths[:, None])
+            cards = self._tableau[columns, rows]
+            self._obs_tableau[columns, rows, np.where(cards & VISIBLE_BIT, 53, cards & CARD_ID_MASK)] = 1
+            self._encoded_lengths = np.minimum(self._lengths, OBS_ROWS).tolist()
+            self._dirty_from = [OBS_ROWS] * NUM_COLUMNS
+        for column, start in enumerate(self._dirty_from):
+            if start >= OBS_ROWS:
+                continue
+            length = min(int(self._lengths[column]), OBS_ROWS)
+            self._obs_tableau[column, start:max(length, self._encoded_lengths[column])] = 0
+            if start < length:
+                cards = self._tableau[column, start:length]
+                index = np.where(cards & VISIBLE_BIT, 53, cards & CARD_ID_MASK)
+                self._obs_tableau[column, np.arange(start, length), index] = 1
+            self._encoded_lengths[column] = length
+            self._dirty_from[column] = OBS_ROWS
 
-        # Pad tableau columns to a fixed length (18 cards)
-        max_length = 18
-        tableau_observation_padded = [
-            column + [[0] * 54] * (max_length - len(column))
-            for column in tableau_observation
-        ]
-
-        # Flatten the tableau for observation
-        tableau_array = np.array(tableau_observation_padded).reshape(-1)
+        # Top card observation
+        has_revealed = bool(self._state[REVEALED_LEN])
+        self._obs_top_card[53] = has_revealed  # Revealed cards are always face-up
+        self._obs_top_card[52] = not has_revealed  # Non-existent card
+
+        return self._observation_dict()
+
+    def _get_compact_observation(self):
+        # Re-encode the tableau slots changed since the last call as card ids
+        if self._dirty_from is None:
+            cards = self._tableau[:, :OBS_ROWS]
+            self._obs_tableau[:] = np.where(np.arange(OBS_ROWS) < self._lengths[:, None],
+                                            np.where(cards & VISIBLE_BIT, cards & CARD_ID_MASK, HIDDEN_CARD_ID),
+                                            EMPTY_CARD_ID)
+            self._dirty_from = [OBS_ROWS] * NUM_COLUMNS
+        for column, start in enumerate(self._dirty_from):
+            if start >= OBS_ROWS:
+                continue
+            length = max(min(int(self._lengths[column]), OBS_ROWS), start)
+            cards = self._tableau[column, start:length]
+            self._obs_tableau[column, start:length] = np.where(cards & VISIBLE_BIT, cards & CARD_ID_MASK, HIDDEN_CARD_ID)
+            self._obs_tableau[column, length:] = EMPTY_CARD_ID
+            self._dirty_from[column] = OBS_ROWS
+
+        revealed_len = self._state[REVEALED_LEN]
+        self._obs_top_card[0] = self._revealed[revealed_len - 1] & CARD_ID_MASK if revealed_len else EMPTY_CARD_ID
+        if self.draw_pile_observation:
+            self._obs_draw_pile[:] = (self._state[DRAW_PILE_LEN], revealed_len, max(self.draw_pile_cycles, 0))
+        return self._observation_dict()
+
+    def _observation_dict(self):
+        # The foundation observation is a view of the foundation heights
+        if self.copy_observations:
+            return {key: value.copy() for key, value in self._observation.items()}
+        return self._observation
+
+    def _record(self, start, stop=None):
+        # Save state[start:stop] before the current step changes it (see undo())
+        if not self.keep_history:
+            return
+        self._delta.append((int(start), self._state[start:start + 1 if stop is None else stop].tobytes()))
+
+    def _write(self, start, data):
+        # Write back bytes saved by _record, marking the changed columns for the observation
+        values = np.frombuffer(data, dtype=np.uint8)
+        if start < TABLEAU.stop:
+            column, row = divmod(start - TABLEAU.start, COLUMN_CAPACITY)
+            self._touch(column, row)
+        elif start < LENGTHS.stop:
+            for offset, length in enumerate(values):
+                column = start - LENGTHS.start + offset
+                self._touch(column, min(length, self._lengths[column]))
+        self._state[start:start + len(values)] = values
+
+    def undo(self):
+        """
+        Reverts the last step (state, reward, tries and draw pile cycles), touching only the
+        bytes that step changed. Returns False if there is nothing to undo (always without
+        keep_history).
+        """
+        if not self._history:
+            return False
+        delta = self._history.pop()
+        writes, counters, _ = delta
+        for start, old, _ in reversed(writes):
+            self._write(start, old)
+        self.draw_pile_cycles, self.tries, self.reward, self.done = counters
+        self._mask_stale = True
+        self._redo.append(delta)
+        return True
 
-        # Foundation observation (unchanged)
-        foundation_observation = [len(pile) for pile in self.foundation]
+    def redo(self):
+        """Re-applies the last undone step. Returns False if there is nothing to redo."""
+        if not self._redo:
+            return False
+        delta = self._redo.pop()
+        writes, _, counters = delta
+        for start, _, new in writes:
+            self._write(start, new)
+        self.draw_pile_cycles, self.tries, self.reward, self.done = counters
+        self._mask_stale = True
+        self._history.append(delta)
+        return True
 
-        # Top card observation
-        if self.revealed_cards:
-            top_card = self.revealed_cards[-1]
-            top_card_observation = card_to_one_hot(top_card)
-        else:
-            top_card_observation = [0] * 54
-            top_card_observation[52] = 1  # Non-existent card
-
-        # Combine all parts of the observation
-        result = {
-            "tableau": tableau_array,
-            "foundation": np.array(foundation_observation),
-            "top_card": np.array(top_card_observation),
-        }
-        return result
+    def snapshot(self, history=True):
+        """
+        Captures the current game (one state buffer copy) so it can be restored later.
+
+        Parameters:
+        - history (bool): Whether to keep the undo history too. Restoring a snapshot taken
+          without it starts with an empty history.
+        """
+        return (self._state.copy(), self.draw_pile_cycles, self.tries, self.reward, self.done,
+                self.deal, self.deck, list(self._history) if history else [])
+
+    def restore(self, snapshot):
+        """Returns to a game captured by snapshot(), including its undo history."""
+        state, self.draw_pile_cycles, self.tries, self.reward, self.done, self.deal, self.deck, history = snapshot
+        self._state[:] = state
+        self._history = list(history)
+        self._redo = []
+        self._dirty_from = None
+        self._mask_stale = True
+
+    def position_hash(self):
+        """64-bit Zobrist hash of the current position (see state.position_hash)."""
+        return position_hash(self._state, self.draw_pile_cycles)
+
+    def _touch(self, column, row):
+        # Mark tableau slots from `row` upwards as changed for _get_observation
+        dirty_from = self._dirty_from
+        if dirty_from is not None and row < dirty_from[column]:
+            dirty_from[column] = int(row)
 
 
     def step(self, action: list):
+        current_reward = self.play(action)
+        if self.stats is None:
+            return self._get_observation(), current_reward, self.done, self.tries <= 0, {}  # False - truncated field (hz zachem), {} - info field (tozhe hz zachem)
+
+        start = time.perf_counter()
+        observation = self._get_observation()
+        elapsed = time.perf_counter() - start
+        self.stats.time["observation"] += elapsed
+        self._step_info["time"]["observation"] = elapsed
+        return observation, current_reward, self.done, self.tries <= 0, self._step_info
+
+    def play(self, action: list):
+        """
+        Applies an action like step() without building the observation (which is re-encoded
+        incrementally by the next step() or reset()), and returns the reward. Used for search
+        and replay, where most intermediate observations are never looked at.
+        """
         # action: [int, list[int,int], int]
         # action_type: int
         # source: list[int,int] - [column, card in column]. Column numbers:
@@ -187,9 +467,15 @@ class SolitaireEnv(gym.Env):
 
         action_type, source1, source2, destination = action
         current_reward = -1   # Base penalty for each action
+        counters = (self.draw_pile_cycles, self.tries, self.reward, self.done)
+        self._delta = []
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter()
+        valid_move_made, invalid_reason = True, None
 
         if action_type == 0:  # Move Card within Tableau
-            valid_move_made, reward = self._move_within_tableau([source1, source2], destination)   # here reward should be negative
+            valid_move_made, reward, invalid_reason = self._move_within_tableau([source1, source2], destination)   # here reward should be negative
             current_reward += reward
             if not valid_move_made:
                 #print("The move isn't valid")
@@ -202,176 +488,271 @@ class SolitaireEnv(gym.Env):
                 current_reward -= 100
 
         elif action_type == 2:  # Move Card to Foundation
-            valid_move_made, reward = self._move_to_foundation(source1)
+            valid_move_made, reward, invalid_reason = self._move_to_foundation(source1)
             current_reward += reward
 
+        if stats is not None:
+            move_end = time.perf_counter()
         flipped_count = self._flip_visible_cards()
         current_reward += flipped_count * 1600
+        if stats is not None:
+            flip_end = time.perf_counter()
 
         # Check if game is won (all foundations complete)
-        if all(len(foundation) == 13 for foundation in self.foundation):
+        if (self._foundation == 13).all():
             self.done = True
+        if stats is not None:
+            self._count_step(action_type, source1, valid_move_made, invalid_reason, flipped_count,
+                             counters[0], (move_end - start, flip_end - move_end, time.perf_counter() - flip_end))
 
         self.reward += current_reward
         self.tries -= 1
+        self._mask_stale = True
+
+        if self.keep_history:
+            # Keep the bytes this step changed, before and after, and the counters for undo()/redo()
+            writes = tuple((start, old, self._state[start:start + len(old)].tobytes()) for start, old in self._delta)
+            self._history.append((writes, counters, (self.draw_pile_cycles, self.tries, self.reward, self.done)))
+            self._redo.clear()
+        return current_reward
+
+    def _count_step(self, action_type, source, valid_move_made, invalid_reason, flipped_count, draw_pile_cycles, times):
+        # Adds a step played with stats on to self.stats and keeps its own stats for the info of step()
+        stats = self.stats
+        stats.steps += 1
+        counts = stats.counts
+        step_time = dict(zip(PHASES, times))
+        for phase, elapsed in step_time.items():
+            stats.time[phase] += elapsed
+        if valid_move_made:
+            counts["valid_moves"] += 1
+        else:
+            counts["invalid_moves"] += 1
+            stats.invalid[invalid_reason] += 1
+        recycled = action_type == 1 and self.draw_pile_cycles < draw_pile_cycles
+        if action_type == 1:
+            counts["draws"] += 1
+            if recycled:
+                counts["recycles"] += 1
+                counts["penalized_recycles"] += self.draw_pile_cycles < 0
+        elif valid_move_made:
+            if action_type == 2:
+                counts["to_foundation"] += 1
+            elif 7 <= source <= 10:
+                counts["from_foundation"] += 1
+        counts["flips"] += flipped_count
+        counts["wins"] += self.done
+        self._step_info = {
+            "time": step_time,
+            "invalid_reason": invalid_reason,
+            "flips": flipped_count,
+            "recycled": recycled,
+        }
 
-        return self._get_observation(), current_reward, self.done, self.tries <= 0, {}  # False - truncated field (hz zachem), {} - info field (tozhe hz zachem)
+    def get_stats(self, reset=False):
+        """
+        Totals of the steps played since the env was created (or the last reset=True) with
+        collect_stats=True, as a dict (see stats.StepStats.as_dict), or None without it.
+        Several envs' stats can be summed with stats.merge_stats.
+        """
+        if self.stats is None:
+            return None
+        totals = self.stats.as_dict()
+        if reset:
+            self.stats = StepStats()
+        return totals
 
     def _draw_card(self):
+        state = self._state
         # Reveal 1 card at a time from the draw pile
-        if self.draw_pile:
-            card = self.draw_pile.pop()
-            card.visible = True
-            self.revealed_cards.append(card)
+        self._record(DRAW_PILE_LEN, REVEALED_LEN + 1)
+        if state[DRAW_PILE_LEN]:
+            state[DRAW_PILE_LEN] -= 1
+            self._record(REVEALED.start + state[REVEALED_LEN])
+            self._revealed[state[REVEALED_LEN]] = self._draw_pile[state[DRAW_PILE_LEN]] | VISIBLE_BIT
+            state[REVEALED_LEN] += 1
             return False
         else:
-            self.draw_pile = self.revealed_cards[::-1]  # Restart the draw pile if we reach the end
-            self.revealed_cards = []
-            self.draw_pile_cycles-=1
+            # Restart the draw pile if we reach the end
+            count = state[REVEALED_LEN]
+            self._record(DRAW_PILE.start, DRAW_PILE.start + count)
+            self._draw_pile[:count] = self._revealed[count - 1::-1] if count else self._revealed[:0]
+            state[DRAW_PILE_LEN] = count
+            state[REVEALED_LEN] = 0
+            self.draw_pile_cycles -= 1
             if self.draw_pile_cycles < 0:
                 return True
 
+    def _top_card(self, column):
+        # Card id on top of a non-empty tableau column
+        return self._tableau[column, self._lengths[column] - 1] & CARD_ID_MASK
 
-    def _is_alternating_color(self, object1, object2):
-        # Check if the objects have alternating colors
-        return self.colors[object1] != self.colors[object2]
-
+    def _push_card(self, column, card):
+        # Put a single card face-up on top of a tableau column
+        self._record(TABLEAU.start + column * COLUMN_CAPACITY + self._lengths[column])
+        self._record(LENGTHS.start + column)
+        self._touch(column, self._lengths[column])
+        self._tableau[column, self._lengths[column]] = card | VISIBLE_BIT
+        self._lengths[column] += 1
 
-    # all return numbers after false are negative, and positive after true
+    # all return numbers after false are negative, and positive after true; the third value
+    # is why the move was invalid (one of stats.INVALID_REASONS), None for valid moves
     def _move_within_tableau(self, source: list[int], destination: int):
         if destination > 6 or destination < 0:
             #print("Wrong destination column")
-            return False, -10
+            return False, -10, "bad_destination"
+        state = self._state
+        lengths = self._lengths
         # If the source is from the draw pile
         if source[0] == 11:
-            if not self.revealed_cards:
+            if not state[REVEALED_LEN]:
                 #print("Invalid move: No cards revealed in the draw pile")
-                return False, -50 # No cards revealed in the draw pile
+                return False, -50, "no_revealed_card" # No cards revealed in the draw pile
             # Use the last revealed card from the draw pile
-            card_to_move = self.revealed_cards[-1]
+            card_to_move = self._revealed[state[REVEALED_LEN] - 1] & CARD_ID_MASK
 
             # Check if destination column is empty (only Kings can move to empty columns)
-            if not self.tableau[destination]:
-                if card_to_move.value == self.king_value: # King card value
-                    self.tableau[destination].append(card_to_move)
-                    self.revealed_cards.pop()  # Remove from revealed list
-                    return True, 500
+            if not lengths[destination]:
+                if CARD_VALUES[card_to_move] == self.king_value: # King card value
+                    self._push_card(destination, card_to_move)
+                    self._record(REVEALED_LEN)
+                    state[REVEALED_LEN] -= 1  # Remove from revealed list
+                    return True, 500, None
                 else:
                     #print("Invalid move: Only Kings can move to an empty column")
-                    return False, -60  # Only Kings can move to an empty column
+                    return False, -60, "king_only"  # Only Kings can move to an empty column
 
             # Check if the move is valid based on the destination column's top card
-            dest_card = self.tableau[destination][-1]
-            if (card_to_move.value == dest_card.value - 1 and
-                self._is_alternating_color(card_to_move.suit, dest_card.suit)):
-                self.tableau[destination].append(card_to_move)
-                self.revealed_cards.pop()  # Remove from revealed list
-                return True, 500
+            if CAN_STACK[card_to_move, self._top_card(destination)]:
+                self._push_card(destination, card_to_move)
+                self._record(REVEALED_LEN)
+                state[REVEALED_LEN] -= 1  # Remove from revealed list
+                return True, 500, None
 
             #print("Invalid move: Invalid move for draw pile card")
-            return False, -50  # Invalid move for draw pile card
+            return False, -50, "does_not_fit"  # Invalid move for draw pile card
 
         if 7 <= source[0] <= 10:
             suit = source[0] - 7
-        if self.foundation[suit] and self.tableau[destination]:
-            card_to_move = self.foundation[suit][-1]
-            dest_card = self.tableau[destination][-1]
-            if (card_to_move.value == dest_card.value - 1 and
-                self._is_alternating_color(card_to_move.suit, dest_card.suit)):
-                self.tableau[destination].append(card_to_move)
-                self.foundation[suit].pop()  # Remove from revealed list
-                return True, 500
-            return False, -50
-        else:
-            return False, -50
+            if self._foundation[suit] and lengths[destination]:
+                card_to_move = suit * 13 + self._foundation[suit] - 1
+                if CAN_STACK[card_to_move, self._top_card(destination)]:
+                    self._push_card(destination, card_to_move)
+                    self._record(FOUNDATION.start + suit)
+                    self._foundation[suit] -= 1  # Remove from foundation
+                    return True, 500, None
+                return False, -50, "does_not_fit"
+            else:
+                return False, -50, "does_not_fit" if self._foundation[suit] else "bad_source"
 
         if source[0] < 0:
             #print("Invalid move: Wrong column number")
-            return False, -100
-        if source[1] >= len(self.tableau[source[0]]):
+            return False, -100, "bad_source"
+        if source[1] >= lengths[source[0]]:
             #print("Invalid move: Wrong card index number")
-            return False, -100
+            return False, -100, "bad_source"
 
         card_column = source[0]
         card_index = source[1]
-        cards_to_move = self.tableau[card_column][card_index:]
+        first_card = self._tableau[card_column, card_index]
+        if card_column == destination or not first_card & VISIBLE_BIT:
+            #print("Invalid move: Can't move onto the same column or move a face-down card")
+            return False, -40, "face_down_or_same_column"
+        first_card &= CARD_ID_MASK
 
         # Check if destination column is empty (only Kings can be moved to an empty column)
-        if not self.tableau[destination]:
-            if cards_to_move[0].value == self.king_value: # King card value
-                # Move the sequence
-                self.tableau[destination].extend(cards_to_move)
-                del self.tableau[card_column][card_index:]
-                return True, 500
-            else:
+        dest_length = lengths[destination]
+        if not dest_length:
+            if CARD_VALUES[first_card] != self.king_value: # King card value
                 #print("Invalid move: Only Kings can be moved to an empty column")
-                return False, -60  # Only Kings can be moved to an empty column
-
+                return False, -60, "king_only"  # Only Kings can be moved to an empty column
         # Check if the move is valid based on the destination column’s top card
-        dest_card = self.tableau[destination][-1]
-        if (cards_to_move[0].value == dest_card.value - 1 and
-                self._is_alternating_color(cards_to_move[0].suit, dest_card.suit)):
-            # Move the sequence
-            self.tableau[destination].extend(cards_to_move)
-            del self.tableau[card_column][card_index:]
-            return True, 500
-
-        #print("Invalid move: Invalid move within tableau")
-        return False, -40  # Move was invalid
+        elif not CAN_STACK[first_card, self._top_card(destination)]:
+            #print("Invalid move: Invalid move within tableau")
+            return False, -40, "does_not_fit"  # Move was invalid
+
+        # Move the sequence
+        count = lengths[card_column] - card_index
+        dest_start = TABLEAU.start + destination * COLUMN_CAPACITY + dest_length
+        self._record(dest_start, dest_start + count)
+        self._record(LENGTHS.start, LENGTHS.stop)
+        self._tableau[destination, dest_length:dest_length + count] = self._tableau[card_column, card_index:lengths[card_column]]
+        lengths[destination] += count
+        lengths[card_column] = card_index
+        self._touch(destination, dest_length)
+        self._touch(card_column, card_index)
+        return True, 500, None
 
 
     def _move_to_foundation(self, source): # source is int, since we move the top card of source to top of foundation
         valid_reward = 130
+        state = self._state
         # If source is the draw pile (denoted by 11), take the last revealed card
         if source == 11:
-            if not self.revealed_cards:
+            if not state[REVEALED_LEN]:
                 #print("Invalid move: No revealed cards in draw pile")
-                return False, -50  # No revealed cards in draw pile
-            card = self.revealed_cards[-1]
-            foundation_index = card.suit # Determine foundation based on suit
+                return False, -50, "no_revealed_card"  # No revealed cards in draw pile
+            card = self._revealed[state[REVEALED_LEN] - 1] & CARD_ID_MASK
+            foundation_index = CARD_SUITS[card] # Determine foundation based on suit
 
-            if len(self.foundation[foundation_index]) == card.value - self.ace_value:  # -ace_value because card values are from 2 to 14
+            if self._foundation[foundation_index] == CARD_VALUES[card] - self.ace_value:  # -ace_value because card values are from 2 to 14
                 # Move the card to the foundation and remove from revealed list
-                self.foundation[foundation_index].append(card)
-                self.revealed_cards.pop()
-                if not card.bonus:
-                    card.bonus = True
-                return True, valid_reward
+                self._record(FOUNDATION.start + foundation_index)
+                self._record(REVEALED_LEN)
+                self._foundation[foundation_index] += 1
+                state[REVEALED_LEN] -= 1
+                return True, valid_reward, None
 
             #print("Invalid move: Invalid move to foundation from draw pile")
-            return False, -40  # Invalid move
+            return False, -40, "does_not_fit"  # Invalid move
 
         # Validate source column
-        if source < 0 or source > 6 or not self.tableau[source]:
+        if source < 0 or source > 6 or not self._lengths[source]:
             #print("Invalid move: No card to move")
-            return False, -60  # Invalid move, no card to move
+            return False, -60, "bad_source"  # Invalid move, no card to move
 
         # Get the top card from the source column
-        card = self.tableau[source][-1]
-        foundation_index = card.suit  # Determine foundation pile based on suit
+        card = self._top_card(source)
+        foundation_index = CARD_SUITS[card]  # Determine foundation pile based on suit
 
         # Check if the card can move to the foundation (must be in ascending order)
-        if len(self.foundation[foundation_index]) == card.value - self.ace_value:     # -ace_value because card values are from 2 to 14
+        if self._foundation[foundation_index] == CARD_VALUES[card] - self.ace_value:     # -ace_value because card values are from 2 to 14
             # Move the card to the foundation and remove from tableau
-            self.foundation[foundation_index].append(self.tableau[source].pop())
-            if not card.bonus:
-                card.bonus = True
-            return True, valid_reward
+            self._record(FOUNDATION.start + foundation_index)
+            self._record(LENGTHS.start + source)
+            self._foundation[foundation_index] += 1
+            self._lengths[source] -= 1
+            self._touch(source, self._lengths[source])
+            return True, valid_reward, None
 
         #print("Invalid move: Invalid move to foundation from tableau")
-        return False, -40  # Move was invalid
+        return False, -40, "does_not_fit"  # Move was invalid
 
 
     def _flip_visible_cards(self):
         flipped_count = 0
-        for column in self.tableau:
-            if column and not column[-1].visible:  # If the top card is face-down
-                column[-1].visible = True  # Flip it face-up
+        for column, length in enumerate(self._lengths):
+            if length and not self._tableau[column, length - 1] & VISIBLE_BIT:  # If the top card is face-down
+                self._record(TABLEAU.start + column * COLUMN_CAPACITY + length - 1)
+                self._tableau[column, length - 1] |= VISIBLE_BIT  # Flip it face-up
+                self._touch(column, length - 1)
                 flipped_count += 1
         return flipped_count
 
 
-    def render(self, mode='human'):
+    def render(self, mode=None):
+        """Renders the game in `mode`, by default the env's render_mode (see __init__)."""
+        mode = mode or self.render_mode or "human"
+        if mode == "ansi":
+            from rendering import render_ansi
+            return render_ansi(self._state)
+        if mode == "rgb_array":
+            from rendering import render_rgb
+            return render_rgb(self._state)
+        if mode != "human":
+            raise ValueError(f"Unknown render mode {mode!r}")
+        console = __getattr__("console")
+
         # Foundations
         foundation_str = []
         for pile in self.foundation:
@@ -399,7 +780,7 @@ class SolitaireEnv(gym.Env):
         console.print("Tableau:\n" + tableau_str)
 
         # Draw pile (remaining count, last 3 revealed, discarded count)
-        draw_pile_display = f"Draw Pile: {len(self.draw_pile)} cards remaining"
+        draw_pile_display = f"Draw Pile: {self._state[DRAW_PILE_LEN]} cards remaining"
 
         # Last 3 revealed cards (if any)
         last_three = [f"|{card.value if card.visible else ' ?'}{' ' if card.visible and len(str(card.value)) != 2 else ''}{['[bold red] ♥[/bold red]', '[bold red] ♦[/bold red]', ' ♣', ' ♠'][card.suit] if card.visible else '  '}|" for card in self.revealed_cards[-3:]]
@@ -409,3 +790,9 @@ class SolitaireEnv(gym.Env):
 
         # Print the full draw pile row
         console.print(draw_pile_display, last_three_display)
+
+
+# gym.make(ENV_ID, **kwargs) once this module is imported, or gym.make("env:Solitaire-v0")
+# to import it by id. The env ends games itself (truncated when out of tries).
+if ENV_ID not in gym.registry:
+    gym.register(id=ENV_ID, entry_point=SolitaireEnv)
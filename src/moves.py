@@ -0,0 +1,173 @@
+import numpy as np
+
+from card import CARD_ID_MASK, VISIBLE_BIT
+from state import (
+    CAN_STACK, CARD_SUITS, CARD_VALUES, COLUMN_CAPACITY, FOUNDATION, LENGTHS, NUM_COLUMNS, REVEALED,
+    REVEALED_LEN,
+)
+
+
+# Actions are [action_type, source_col, source_idx, destination]; flat action indices
+# (used by action masks and the pretraining model) enumerate this shape in C order
+ACTION_SHAPE = (3, 12, 18, 7)
+NUM_ACTIONS = int(np.prod(ACTION_SHAPE))
+MAX_SOURCE_INDEX = ACTION_SHAPE[2]
+DRAW_ACTION = 1 * (12 * 18 * 7)  # [1, 0, 0, 0]
+
+# Lookup tables indexed by card id (0-51)
+IS_KING = CARD_VALUES == 13
+# FOUNDATION_READY[card, height]: card goes next on a foundation holding `height` cards of its suit
+FOUNDATION_READY = CARD_VALUES[:, None] - 1 == np.arange(14)[None, :]
+# Plain Python versions for the per-game move generator
+VALUES = tuple(CARD_VALUES.tolist())
+SUITS = tuple(CARD_SUITS.tolist())
+KINGS = tuple(np.flatnonzero(IS_KING).tolist())
+# STACK_CANDIDATES[card]: the two cards that can be put on `card` in the tableau
+STACK_CANDIDATES = tuple(tuple(np.flatnonzero(CAN_STACK[:, card]).tolist()) for card in range(52))
+
+
+def encode_action(action):
+    """Flat index of an action [action_type, source_col, source_idx, destination]."""
+    action_type, source_col, source_idx, dest_col = action
+    return action_type * (12 * 18 * 7) + source_col * (18 * 7) + source_idx * 7 + dest_col
+
+
+def check_action(action):
+    """
+    Raises ValueError unless `action` is [action_type, source_col, source_idx, destination]
+    within ACTION_SHAPE, i.e. in the action space (step() also accepts, and penalizes,
+    actions outside it, but they can't be recorded or encoded).
+    """
+    if len(action) != len(ACTION_SHAPE) or not all(0 <= value < size for value, size in zip(action, ACTION_SHAPE)):
+        raise ValueError(f"Expected [action_type, source_col, source_idx, destination] within {ACTION_SHAPE}, "
+                         f"got {list(action)}")
+
+
+def decode_action(action_index):
+    """Inverse of encode_action."""
+    action_type = action_index // (12 * 18 * 7)
+    remaining = action_index % (12 * 18 * 7)
+
+    source_col = remaining // (18 * 7)
+    remaining = remaining % (18 * 7)
+
+    source_idx = remaining // 7
+    dest_col = remaining % 7
+
+    return [action_type, source_col, source_idx, dest_col]
+
+
+def tableau_fits(cards, tops, empty):
+    """
+    Whether each card can be put on each tableau column.
+
+    Parameters:
+    - cards (ndarray): Card ids, any shape (...).
+    - tops (ndarray): Card ids on top of the destination columns, shape (..., k) or (k,).
+    - empty (ndarray): Whether each destination column is empty, same shape as tops.
+
+    Returns:
+    - ndarray: Boolean array of shape (..., k); only Kings fit on empty columns.
+    """
+    cards = np.asarray(cards)[..., None]
+    return np.where(empty, IS_KING[cards], CAN_STACK[cards, tops])
+
+
+def column_tops(tableau, lengths):
+    """Card ids on top of every column (meaningless for empty columns); works on batches."""
+    top = np.maximum(lengths.astype(np.intp) - 1, 0)[..., None]
+    return np.take_along_axis(tableau, top, axis=-1)[..., 0] & CARD_ID_MASK
+
+
+def legal_move_mask(tableau, lengths, foundation, revealed_top, has_revealed):
+    """
+    Exact mask of legal actions for a batch of games, computed with array operations.
+
+    Parameters:
+    - tableau (ndarray): Card bytes, shape (n, 7, capacity).
+    - lengths (ndarray): Column lengths, shape (n, 7).
+    - foundation (ndarray): Foundation heights, shape (n, 4).
+    - revealed_top (ndarray): Card id on top of the revealed draw pile cards, shape (n,).
+    - has_revealed (ndarray): Whether any draw pile card is revealed, shape (n,).
+
+    Returns:
+    - ndarray: Boolean mask of shape (n, 3, 12, 18, 7), see legal_move_indices for the layout.
+    """
+    n = len(tableau)
+    mask = np.zeros((n,) + ACTION_SHAPE, dtype=bool)
+    empty = lengths == 0
+    tops = column_tops(tableau, lengths)
+    heights = foundation.astype(np.intp)
+
+    # Tableau to tableau: face-up source card that fits on another column
+    cards = tableau[:, :, :MAX_SOURCE_INDEX]
+    movable = ((cards & VISIBLE_BIT) != 0) & (np.arange(MAX_SOURCE_INDEX) < lengths[..., None])
+    fits = tableau_fits(cards & CARD_ID_MASK, tops[:, None, None, :], empty[:, None, None, :])
+    mask[:, 0, :NUM_COLUMNS] = fits & movable[..., None] & ~np.eye(NUM_COLUMNS, dtype=bool)[:, None, :]
+    # Draw pile to tableau
+    mask[:, 0, 11, 0, :] = tableau_fits(revealed_top, tops, empty) & has_revealed[:, None]
+    # Foundation to tableau, never onto an empty column
+    foundation_tops = np.maximum(np.arange(4) * 13 + heights - 1, 0)
+    mask[:, 0, 7:11, 0, :] = (CAN_STACK[foundation_tops[:, :, None], tops[:, None, :]]
+                              & (heights > 0)[:, :, None] & ~empty[:, None, :])
+    # Tableau and draw pile to foundation
+    suit_heights = np.take_along_axis(heights, CARD_SUITS[tops], axis=1)
+    mask[:, 2, :NUM_COLUMNS, 0, 0] = FOUNDATION_READY[tops, suit_heights] & ~empty
+    suit_height = heights[np.arange(n), CARD_SUITS[revealed_top]]
+    mask[:, 2, 11, 0, 0] = FOUNDATION_READY[revealed_top, suit_height] & has_revealed
+    # Drawing is always allowed
+    mask[:, 1, 0, 0, 0] = True
+    return mask
+
+
+def legal_move_indices(state):
+    """
+    Flat indices (see encode_action) of the legal actions of one game.
+
+    Instead of trying every action, this looks up the cards that can go on each column:
+    for every destination only two cards (or the four Kings, for an empty column) fit,
+    so the cost is proportional to the number of face-up cards.
+
+    Moves from the draw pile (11) and the foundations (7-10) use source_idx 0, moves to the
+    foundation use source_idx 0 and destination 0, and drawing is [1, 0, 0, 0].
+
+    Parameters:
+    - state (list): The game's flat state buffer (see state.py) as a list of ints.
+    """
+    lengths = state[LENGTHS]
+    heights = state[FOUNDATION]
+    indices = [DRAW_ACTION]
+
+    # Face-up cards that can be picked up from the tableau, with their position
+    visible = {}
+    for column, length in enumerate(lengths):
+        base = column * COLUMN_CAPACITY
+        for row in range(min(length, MAX_SOURCE_INDEX) - 1, -1, -1):
+            code = state[base + row]
+            if not code & VISIBLE_BIT:
+                break
+            visible[code & CARD_ID_MASK] = column * (18 * 7) + row * 7
+
+    revealed_len = state[REVEALED_LEN]
+    revealed_top = state[REVEALED.start + revealed_len - 1] & CARD_ID_MASK if revealed_len else None
+    if revealed_top is not None and heights[SUITS[revealed_top]] == VALUES[revealed_top] - 1:
+        indices.append(2 * (12 * 18 * 7) + 11 * (18 * 7))
+
+    for destination, length in enumerate(lengths):
+        if length:
+            top = state[destination * COLUMN_CAPACITY + length - 1] & CARD_ID_MASK
+            if heights[SUITS[top]] == VALUES[top] - 1:
+                indices.append(2 * (12 * 18 * 7) + destination * (18 * 7))
+            candidates = STACK_CANDIDATES[top]
+            for card in candidates:
+                if heights[SUITS[card]] == VALUES[card]:  # On top of its foundation
+                    indices.append((7 + SUITS[card]) * (18 * 7) + destination)
+        else:
+            candidates = KINGS
+        for card in candidates:
+            source = visible.get(card)
+            if source is not None and source // (18 * 7) != destination:
+                indices.append(source + destination)
+            if card == revealed_top:
+                indices.append(11 * (18 * 7) + destination)
+    return indices
@@ -0,0 +1,314 @@
+import collections
+import json
+import os
+
+import numpy as np
+
+from deals import DealPool
+from env import SolitaireEnv
+from moves import decode_action, encode_action
+from replay import read_episodes
+
+
+# One cached position on disk. action: best known action (flat index, NO_ACTION if none);
+# distance: moves to a win with it (NO_DISTANCE if unknown); dead_end: the solver ran out
+# of positions without finding a win from this deal (only recorded for deals: the search
+# prunes moves and is bounded by the tries left, so this is a strong hint, not a proof);
+# visits/wins: games that went through it and how many of those were won.
+ENTRY_DTYPE = np.dtype([
+    ("key", "<u8"),
+    ("action", "<u2"),
+    ("distance", "<i2"),
+    ("dead_end", np.bool_),
+    ("visits", "<u4"),
+    ("wins", "<u4"),
+])
+NO_ACTION = 0xFFFF
+NO_DISTANCE = -1
+FLUSH_CHUNK = 1 << 16  # Rows of the on-disk table merged at a time by flush()
+
+Position = collections.namedtuple("Position", ["action", "distance", "dead_end", "visits", "wins"])
+Position.__doc__ = """\
+What is known about a position: best action ([action_type, source_col, source_idx,
+destination], or None), moves to a win with it (or None), whether the solver found no win
+from it (deals only, see ENTRY_DTYPE), and how many recorded games went through it and were
+won."""
+
+
+def _merge(entry, action=None, distance=None, dead_end=False, visits=0, wins=0):
+    # entry: [action, distance, dead_end, visits, wins] as stored, updated in place.
+    # A shorter win replaces the best action; a known win overrides a dead end.
+    if distance is not None and (entry[1] == NO_DISTANCE or distance < entry[1]):
+        entry[0] = NO_ACTION if action is None else action
+        entry[1] = distance
+    elif action is not None and entry[0] == NO_ACTION:
+        entry[0] = action
+    entry[2] = (entry[2] or dead_end) and entry[1] == NO_DISTANCE
+    entry[3] += visits
+    entry[4] += wins
+
+
+class PositionCache:
+    """
+    Known positions, keyed by SolitaireEnv.position_hash() (tableau, foundation, draw pile
+    and revealed cards in order, and draw pile cycles left; not the tries left).
+
+    Recently used positions are kept in memory, least recently used ones evicted beyond
+    `capacity`. The rest is in an on-disk file, a .npy array of ENTRY_DTYPE sorted by key
+    that is memory-mapped and binary-searched. Changes are written to it by flush() (and
+    close(), or when more than `capacity` changes are waiting), which merges them into a new
+    sorted file.
+    """
+
+    def __init__(self, path=None, capacity=100_000):
+        """
+        Parameters:
+        - path (str): Backing .npy file (created by the first flush() if missing). None keeps
+          the cache in memory only, without eviction.
+        - capacity (int): Positions kept in memory.
+        """
+        self.path = path
+        self.capacity = capacity
+        self._memory = collections.OrderedDict()  # key: entry list, most recently used last
+        self._dirty = {}  # key: entry list changed since the last flush
+        self._disk = None
+        if path is not None and os.path.exists(path):
+            self._disk = np.load(path, mmap_mode="r")
+
+    def _find(self, key):
+        # Entry list of a key (loaded into memory if it is on disk), or None
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            return entry
+        entry = self._dirty.get(key)
+        if entry is None and self._disk is not None:
+            index = self._disk_index(key)
+            if index is not None:
+                record = self._disk[index]
+                entry = [int(record["action"]), int(record["distance"]), bool(record["dead_end"]),
+                         int(record["visits"]), int(record["wins"])]
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+
+    def _disk_index(self, key):
+        # Row of a key in the on-disk table, or None. Binary search reading one row per
+        # step: np.searchsorted would first copy the whole (strided) key column of the memmap
+        keys = self._disk["key"]
+        key = np.uint64(key)
+        low, high = 0, len(keys)
+        while low < high:
+            middle = (low + high) // 2
+            if keys[middle] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < len(keys) and keys[low] == key else None
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        if self.path is not None and len(self._memory) > self.capacity:
+            # Evicted entries that changed stay in _dirty until the next flush
+            self._memory.popitem(last=False)
+
+    def lookup(self, key):
+        """The Position of a hash key, or None if it isn't known."""
+        entry = self._find(int(key))
+        if entry is None:
+            return None
+        action, distance, dead_end, visits, wins = entry
+        return Position(None if action == NO_ACTION else decode_action(action),
+                        None if distance == NO_DISTANCE else distance, dead_end, visits, wins)
+
+    def lookup_env(self, env):
+        """The Position of the current state of a SolitaireEnv, or None."""
+        return self.lookup(env.unwrapped.position_hash())
+
+    def best_action(self, env):
+        """Best known action in the current state of a SolitaireEnv, or None."""
+        position = self.lookup_env(env)
+        return None if position is None else position.action
+
+    def known_line(self, env, max_moves=1000):
+        """
+        Winning line from the current state of a SolitaireEnv (left as it was) made of the
+        best known actions, or None if they don't lead to a win before the env's tries run out.
+        """
+        env = env.unwrapped
+        start = env.snapshot()
+        line = []
+        try:
+            while not env.done and env.tries > 0 and len(line) < max_moves:
+                entry = self._find(env.position_hash())
+                if entry is None or entry[1] == NO_DISTANCE:
+                    return None
+                line.append(decode_action(entry[0]))
+                env.play(line[-1])
+            return line if env.done else None
+        finally:
+            env.restore(start)
+
+    def __contains__(self, key):
+        return self._find(int(key)) is not None
+
+    def update(self, key, action=None, distance=None, dead_end=False, visits=0, wins=0):
+        """
+        Adds what was learned about a position: an action with the number of moves to a
+        win it leads to (kept if shorter than the known one), a dead end (meant for deals,
+        see ENTRY_DTYPE), or visits.
+
+        Parameters:
+        - action (list or int): [action_type, source_col, source_idx, destination] or flat index.
+        """
+        key = int(key)
+        if action is not None:
+            action = int(action) if np.isscalar(action) else encode_action(action)
+        entry = self._find(key)
+        if entry is None:
+            entry = [NO_ACTION, NO_DISTANCE, False, 0, 0]
+            self._remember(key, entry)
+        _merge(entry, action, distance, dead_end, visits, wins)
+        self._dirty[key] = entry
+        if len(self._dirty) > self.capacity:
+            self.flush()
+
+    def import_line(self, env, actions, won=None, visits=1):
+        """
+        Plays a line of actions from the current state of a SolitaireEnv (which is left as
+        it was) and records every position on the way: visits, and if the line ends in a win,
+        each action with its distance to it.
+
+        Parameters:
+        - won (bool): Whether the line wins (checked by playing it when None).
+        """
+        env = env.unwrapped
+        start = env.snapshot()
+        keys = []
+        try:
+            for action in actions:
+                keys.append(env.position_hash())
+                env.play(action if not np.isscalar(action) else decode_action(int(action)))
+            if won is None:
+                won = env.done
+        finally:
+            env.restore(start)
+        for step, (key, action) in enumerate(zip(keys, actions)):
+            self.update(key, action, len(actions) - step if won else None, visits=visits, wins=int(won) * visits)
+
+    def import_solutions(self, path, deal_pool=None):
+        """
+        Imports the solutions written by solver.py (solutions.jsonl); deals whose search
+        was exhausted without a solution are marked as dead ends.
+
+        Returns:
+        - int: Number of games imported.
+        """
+        env = SolitaireEnv(deal_pool=deal_pool)
+        count = 0
+        with open(path) as file:
+            for line in file:
+                result = json.loads(line)
+                if deal_pool is None:
+                    env.reset(seed=result["deal"])
+                else:
+                    env.reset(options={"deal": result["deal"]})
+                if result["actions"] is not None:
+                    self.import_line(env, result["actions"], won=True, visits=0)
+                elif result["status"] == "exhausted":
+                    self.update(env.position_hash(), dead_end=True)
+                count += 1
+        return count
+
+    def import_episodes(self, path):
+        """
+        Imports the games of an episode log (replay.py): the visits of every position, and
+        the moves of the won games with their distances to the win.
+
+        Returns:
+        - int: Number of games imported.
+        """
+        env = SolitaireEnv()
+        count = 0
+        for deck, actions in read_episodes(path):
+            env.reset(options={"deck": deck})
+            self.import_line(env, actions)
+            count += 1
+        return count
+
+    def flush(self):
+        """
+        Writes the changed positions to the backing file, merging them into it FLUSH_CHUNK
+        rows at a time, so memory use is bounded by `capacity` whatever the file size.
+        """
+        if self.path is None or not self._dirty:
+            return
+        changed = np.empty(len(self._dirty), dtype=ENTRY_DTYPE)
+        changed["key"] = np.fromiter(self._dirty, dtype=np.uint64, count=len(self._dirty))
+        for name, values in zip(ENTRY_DTYPE.names[1:], zip(*self._dirty.values())):
+            changed[name] = values
+        changed = changed[np.argsort(changed["key"])]
+        parts = list(self._merge_parts(changed["key"]))
+        # Changed entries already include what the file knew about them: they replace its rows
+        disk_rows = 0 if self._disk is None else len(self._disk)
+        replaced = 0 if not disk_rows else sum(
+            int(np.isin(changed["key"][low:high], self._disk["key"][start:stop]).sum())
+            for (start, stop), (low, high) in parts)
+
+        temporary = self.path + ".tmp.npy"
+        merged = np.lib.format.open_memmap(temporary, mode="w+", dtype=ENTRY_DTYPE,
+                                           shape=(disk_rows + len(changed) - replaced,))
+        position = 0
+        for (start, stop), (low, high) in parts:
+            new = changed[low:high]
+            rows = np.empty(0, dtype=ENTRY_DTYPE) if self._disk is None else self._disk[start:stop]
+            rows = np.concatenate([rows[~np.isin(rows["key"], new["key"])], new])
+            merged[position:position + len(rows)] = rows[np.argsort(rows["key"], kind="stable")]
+            position += len(rows)
+        merged.flush()
+        del merged
+        self._disk = None
+        os.replace(temporary, self.path)
+        self._disk = np.load(self.path, mmap_mode="r")
+        self._dirty = {}
+
+    def _merge_parts(self, changed_keys):
+        # Yields ((start, stop) rows of the on-disk table, (low, high) of the sorted changed
+        # keys) to merge together: the changed keys below the next chunk's first key
+        if self._disk is None or not len(self._disk):
+            yield (0, 0), (0, len(changed_keys))
+            return
+        keys = self._disk["key"]
+        low = 0
+        for start in range(0, len(keys), FLUSH_CHUNK):
+            stop = min(start + FLUSH_CHUNK, len(keys))
+            high = len(changed_keys) if stop == len(keys) else int(np.searchsorted(changed_keys, keys[stop]))
+            yield (start, stop), (low, high)
+            low = high
+
+    def close(self):
+        """Flushes the changes."""
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import solver solutions and episode logs into a position cache.")
+    parser.add_argument("cache", help="position cache .npy file")
+    parser.add_argument("--solutions", nargs="*", default=[], help="solutions.jsonl files written by solver.py")
+    parser.add_argument("--episodes", nargs="*", default=[], help="episode logs written by replay.EpisodeLog")
+    parser.add_argument("--deal-pool", help="DealPool .npy file the solutions were dealt from")
+    args = parser.parse_args()
+
+    with PositionCache(args.cache) as cache:
+        deal_pool = None if args.deal_pool is None else DealPool(args.deal_pool)
+        games = sum(cache.import_solutions(path, deal_pool) for path in args.solutions)
+        games += sum(cache.import_episodes(path) for path in args.episodes)
+    print(f"Imported {games} games into {args.cache}")
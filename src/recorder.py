@@ -0,0 +1,200 @@
+import glob
+import json
+import os
+
+import numpy as np
+
+from moves import check_action
+
+TABLEAU_BITS = 7 * 18 * 54  # Length of the one-hot tableau observation
+TABLEAU_BYTES = (TABLEAU_BITS + 7) // 8
+
+# One transition on disk: the observation it was taken in (tableau bit-packed, top card as
+# the index of its one-hot entry), the action, its reward and whether it ended the game.
+# Shards are plain arrays of these records, so they can be memory-mapped with this dtype.
+RECORD_DTYPE = np.dtype([
+    ("tableau", np.uint8, (TABLEAU_BYTES,)),
+    ("foundation", np.uint8, (4,)),
+    ("top_card", np.uint8),
+    ("action", np.uint8, (4,)),
+    ("reward", "<f4"),
+    ("done", np.bool_),
+])
+SHARD_SUFFIX = ".bin"
+
+
+def pack_observation(observation, record):
+    """Writes an observation dict (as returned by SolitaireEnv) into a record."""
+    record["tableau"] = np.packbits(np.asarray(observation["tableau"], dtype=bool))
+    record["foundation"] = observation["foundation"]
+    record["top_card"] = np.argmax(observation["top_card"])
+
+
+def unpack_tableau(packed):
+    """One-hot tableau observations (..., 6804) of packed record tableaus (..., TABLEAU_BYTES)."""
+    return np.unpackbits(packed, axis=-1, count=TABLEAU_BITS)
+
+
+def shard_paths(directory, prefix="trajectories"):
+    """Shard files written to `directory` by recorders with this prefix, in order."""
+    return sorted(glob.glob(os.path.join(directory, f"{prefix}-*{SHARD_SUFFIX}")))
+
+
+def next_number(directory, prefix, suffix):
+    """
+    Number for the next file named <prefix>-<number><suffix> in `directory`: one after the
+    highest existing one (0 if none), so files whose earlier neighbours were deleted are
+    never written over.
+    """
+    start, end = len(prefix) + 1, -len(suffix)
+    numbers = [int(name[start:end]) for name in os.listdir(directory)
+               if name.startswith(prefix + "-") and name.endswith(suffix) and name[start:end].isdigit()]
+    return max(numbers, default=-1) + 1
+
+
+class TrajectoryRecorder:
+    """
+    Streams (observation, action, reward, done) transitions to binary shard files.
+
+    Records go into a fixed-size buffer that is appended to the current shard every
+    `flush_every` transitions, so memory use doesn't grow with the number of games and a
+    crash loses at most one buffer. A new shard is started every `shard_size` transitions.
+
+    Shards are named <prefix>-<number>.bin and numbered after the highest one already in
+    the directory (an existing shard is never overwritten), so several runs (or processes with different prefixes) can record into the
+    same directory. See RECORD_DTYPE for the format.
+    """
+
+    def __init__(self, directory, prefix="trajectories", shard_size=1 << 16, flush_every=1024):
+        """
+        Parameters:
+        - directory (str): Where to write the shards (created if needed).
+        - prefix (str): Start of the shard file names.
+        - shard_size (int): Transitions per shard.
+        - flush_every (int): Transitions buffered in memory between writes.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self._buffer = np.zeros(min(flush_every, shard_size), dtype=RECORD_DTYPE)
+        self._buffered = 0
+        self._shard = next_number(directory, prefix, SHARD_SUFFIX)
+        self._file = None
+        self._written = 0  # Records already written to the current shard
+        self.count = 0  # Transitions recorded (and not popped) in total
+
+    def record(self, observation, action, reward, done):
+        """
+        Adds the transition of taking `action` in `observation`. Raises ValueError for an
+        action outside the action space (see moves.check_action), which a record can't hold.
+        """
+        check_action(action)
+        record = self._buffer[self._buffered]
+        pack_observation(observation, record)
+        record["action"] = action
+        record["reward"] = reward
+        record["done"] = done
+        self._buffered += 1
+        self.count += 1
+        if self._buffered == len(self._buffer) or self._written + self._buffered == self.shard_size:
+            self.flush()
+
+    def pop(self):
+        """Removes the last recorded transition (e.g. after an undo), even if already written."""
+        if self._buffered:
+            self._buffered -= 1
+        elif self._written:
+            if self._file is None:  # Closed since
+                self._open(self._written)
+            self._written -= 1
+            self._file.truncate(self._written * RECORD_DTYPE.itemsize)
+            self._file.seek(0, os.SEEK_END)
+        elif self._shard and self._file is None and self.count:
+            # The last shard is full and the next one isn't started yet
+            self._shard -= 1
+            self._open(self.shard_size)
+            self.pop()
+            return
+        else:
+            raise IndexError("pop from an empty recorder")
+        self.count -= 1
+
+    def flush(self):
+        """Writes the buffered transitions to the current shard."""
+        if not self._buffered:
+            return
+        if self._file is None:
+            # A new shard, or the current one again if the recorder was closed since
+            self._open(self._written)
+        self._buffer[:self._buffered].tofile(self._file)
+        self._file.flush()
+        self._written += self._buffered
+        self._buffered = 0
+        if self._written == self.shard_size:
+            self._file.close()
+            self._file = None
+            self._written = 0
+            self._shard += 1
+
+    def close(self):
+        """Flushes and closes the current shard."""
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open(self, written):
+        path = os.path.join(self.directory, f"{self.prefix}-{self._shard:05d}{SHARD_SUFFIX}")
+        # "xb": a new shard fails rather than truncate a file written by another recorder
+        self._file = open(path, "r+b" if written else "xb")
+        self._file.seek(0, os.SEEK_END)
+        self._written = written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _fits(action):
+    try:
+        check_action(action)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def convert_json(json_paths, directory, prefix="trajectories", **kwargs):
+    """
+    Converts datasets saved by the old main.py (gameplay_data*.json, lists of
+    {"state": observation, "action": action}) into shards.
+
+    The JSON files have no rewards, so rewards are stored as NaN; the last transition of
+    every file is marked as done, since every file holds one game. Transitions with actions
+    outside the action space (mistyped moves, see moves.check_action) are skipped.
+
+    Returns:
+    - int: Number of transitions converted.
+    """
+    with TrajectoryRecorder(directory, prefix, **kwargs) as recorder:
+        for path in json_paths:
+            with open(path) as f:
+                dataset = json.load(f)
+            dataset = [sample for sample in dataset if _fits(sample["action"])]
+            for step, sample in enumerate(dataset):
+                recorder.record(sample["state"], sample["action"], np.nan, step == len(dataset) - 1)
+        return recorder.count
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert gameplay_data*.json datasets to binary shards.")
+    parser.add_argument("json_paths", nargs="+")
+    parser.add_argument("--output", default="gameplay_data")
+    parser.add_argument("--prefix", default="trajectories")
+    args = parser.parse_args()
+    count = convert_json(args.json_paths, args.output, args.prefix)
+    print(f"Converted {count} transitions to {args.output}")
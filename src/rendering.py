@@ -0,0 +1,257 @@
+import functools
+import os
+
+import cv2
+import numpy as np
+
+from card import CARD_ID_MASK, VISIBLE_BIT
+from detector import ICONS_PATH, load_templates
+from recorder import next_number
+from state import (
+    CARD_SUITS, CARD_VALUES, COLUMN_CAPACITY, DRAW_PILE_LEN, FOUNDATION, LENGTHS, NUM_COLUMNS, REVEALED,
+    REVEALED_LEN, STATE_SIZE,
+)
+
+
+RANK_NAMES = ("A", "2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K")
+SUIT_SYMBOLS = ("♥", "♦", "♣", "♠")
+
+# Text of every packed card byte (card.py), 3 characters wide
+CARD_GLYPHS = tuple(
+    f"{RANK_NAMES[CARD_VALUES[code & CARD_ID_MASK] - 1]:>2}{SUIT_SYMBOLS[CARD_SUITS[code & CARD_ID_MASK]]}"
+    if code & VISIBLE_BIT and code & CARD_ID_MASK < 52 else "###"
+    for code in range(1 << 7)
+)
+EMPTY_GLYPH = "---"
+
+# Geometry of the rgb_array frames (pixels): cards, the gaps between them, and how far
+# down the next card of a column starts after a face-down and a face-up card
+CARD_WIDTH, CARD_HEIGHT = 50, 70
+GAP_X, MARGIN = 6, 8
+HIDDEN_DY, VISIBLE_DY = 10, 22
+TABLEAU_Y = MARGIN + CARD_HEIGHT + 12
+FRAME_WIDTH = 2 * MARGIN + NUM_COLUMNS * CARD_WIDTH + (NUM_COLUMNS - 1) * GAP_X
+# Tallest possible column: 6 face-down cards under a King..Ace run
+FRAME_HEIGHT = TABLEAU_Y + 6 * HIDDEN_DY + 12 * VISIBLE_DY + CARD_HEIGHT + MARGIN
+
+TABLE_COLOR = (16, 110, 52)
+BACK_COLOR = (40, 70, 160)
+EMPTY_COLOR = (30, 135, 70)
+# Tile index of an empty pile, after the 128 packed card bytes
+EMPTY_TILE = 1 << 7
+
+TABLE = np.empty((FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8)
+TABLE[:] = TABLE_COLOR
+TABLE.flags.writeable = False
+
+
+def render_ansi(state):
+    """
+    Text picture of a game state (the uint8 buffer of state.py): foundation tops, draw pile
+    size and top revealed card, then the tableau columns side by side, face-down cards
+    as ###.
+    """
+    state = state.tolist()
+    foundation = [CARD_GLYPHS[VISIBLE_BIT | suit * 13 + height - 1] if height else EMPTY_GLYPH
+                  for suit, height in enumerate(state[FOUNDATION])]
+    revealed_len = state[REVEALED_LEN]
+    top_card = CARD_GLYPHS[state[REVEALED.start + revealed_len - 1]] if revealed_len else EMPTY_GLYPH
+    lines = [f"Foundation: {' '.join(foundation)}   Draw pile: {state[DRAW_PILE_LEN]:2}   Top card: {top_card}"]
+
+    lengths = state[LENGTHS]
+    columns = [state[column * COLUMN_CAPACITY:column * COLUMN_CAPACITY + length]
+               for column, length in enumerate(lengths)]
+    for row in range(max(max(lengths), 1)):
+        lines.append(" ".join(
+            CARD_GLYPHS[cards[row]] if row < len(cards) else (EMPTY_GLYPH if not row else "   ")
+            for cards in columns
+        ).rstrip())
+    return "\n".join(lines)
+
+
+@functools.lru_cache(maxsize=None)
+def card_tiles(icons_path=ICONS_PATH):
+    """
+    Pre-rendered RGB card images, shape (129, CARD_HEIGHT, CARD_WIDTH, 3): one per packed
+    card byte (faces from the icons/ templates, backs for face-down cards) and EMPTY_TILE
+    for an empty pile. Built once per icons path.
+    """
+    ranks, suits = load_templates(icons_path)
+    ranks = {value: cv2.cvtColor(icon, cv2.COLOR_GRAY2RGB) for value, icon in ranks}
+    suits = {suit: cv2.cvtColor(icon, cv2.COLOR_BGR2RGB) for suit, icon in suits}
+
+    tiles = np.empty((EMPTY_TILE + 1, CARD_HEIGHT, CARD_WIDTH, 3), dtype=np.uint8)
+    back = np.full((CARD_HEIGHT, CARD_WIDTH, 3), 255, dtype=np.uint8)
+    cv2.rectangle(back, (3, 3), (CARD_WIDTH - 4, CARD_HEIGHT - 4), BACK_COLOR, cv2.FILLED)
+    cv2.rectangle(back, (0, 0), (CARD_WIDTH - 1, CARD_HEIGHT - 1), (90, 90, 90), 1)
+    tiles[:] = back
+    for card in range(52):
+        face = tiles[VISIBLE_BIT | card]
+        face[:] = 255
+        cv2.rectangle(face, (0, 0), (CARD_WIDTH - 1, CARD_HEIGHT - 1), (90, 90, 90), 1)
+        rank, suit = ranks[CARD_VALUES[card]], suits[CARD_SUITS[card]]
+        face[3:3 + rank.shape[0], 3:3 + rank.shape[1]] = rank
+        face[3:3 + suit.shape[0], CARD_WIDTH - 3 - suit.shape[1]:CARD_WIDTH - 3] = suit
+        large = cv2.resize(suit, (2 * suit.shape[1], 2 * suit.shape[0]), interpolation=cv2.INTER_AREA)
+        x, y = (CARD_WIDTH - large.shape[1]) // 2, CARD_HEIGHT - 4 - large.shape[0]
+        face[y:y + large.shape[0], x:x + large.shape[1]] = large
+    tiles[EMPTY_TILE] = TABLE_COLOR
+    cv2.rectangle(tiles[EMPTY_TILE], (0, 0), (CARD_WIDTH - 1, CARD_HEIGHT - 1), EMPTY_COLOR, 2)
+    tiles.flags.writeable = False
+    return tiles
+
+
+def column_x(column):
+    """Left edge of a tableau column (and of the top row pile above it) in rgb_array frames."""
+    return MARGIN + column * (CARD_WIDTH + GAP_X)
+
+
+def render_rgb(state, out=None, icons_path=ICONS_PATH):
+    """
+    Image of a game state (the uint8 buffer of state.py), shape (FRAME_HEIGHT, FRAME_WIDTH, 3)
+    RGB, composited from the pre-rendered tiles of card_tiles(). Top row: draw pile, top
+    revealed card, and the four foundations; below it the tableau.
+
+    Parameters:
+    - out (ndarray): Frame to draw into instead of a new array.
+    """
+    tiles = card_tiles(icons_path)
+    if out is None:
+        frame = TABLE.copy()
+    else:
+        frame = out
+        frame[:] = TABLE
+    state = state.tolist()
+
+    def place(tile, x, y):
+        frame[y:y + CARD_HEIGHT, x:x + CARD_WIDTH] = tiles[tile]
+
+    draw_pile_len, revealed_len = state[DRAW_PILE_LEN], state[REVEALED_LEN]
+    place(0 if draw_pile_len else EMPTY_TILE, column_x(0), MARGIN)  # 0: a face-down card
+    if draw_pile_len:
+        cv2.putText(frame, str(draw_pile_len), (column_x(0) + 12, MARGIN + 42), cv2.FONT_HERSHEY_SIMPLEX, 0.6,
+                    (255, 255, 255), 2)
+    place(state[REVEALED.start + revealed_len - 1] if revealed_len else EMPTY_TILE, column_x(1), MARGIN)
+    for suit, height in enumerate(state[FOUNDATION]):
+        place(VISIBLE_BIT | suit * 13 + height - 1 if height else EMPTY_TILE, column_x(3 + suit), MARGIN)
+
+    for column, length in enumerate(state[LENGTHS]):
+        x, y = column_x(column), TABLEAU_Y
+        if not length:
+            place(EMPTY_TILE, x, y)
+        for code in state[column * COLUMN_CAPACITY:column * COLUMN_CAPACITY + length]:
+            place(code, x, y)
+            y += VISIBLE_DY if code & VISIBLE_BIT else HIDDEN_DY
+    return frame
+
+
+class EpisodeRecorder:
+    """
+    Records the games an env plays as compact episode files, to render or encode later.
+
+    Only the game state (the 194-byte buffer of state.py) is kept for every step, with
+    the action and reward, so recording costs one small copy per step whatever the render
+    mode. An episode is saved as a compressed .npz (a few KB) when it ends; render_episode
+    turns it back into text or frames, and write_video into a GIF or video.
+    """
+
+    def __init__(self, directory, prefix="episode"):
+        """
+        Parameters:
+        - directory (str): Where to write the episodes (created if needed).
+        - prefix (str): Start of the episode file names, <prefix>-<number>.npz.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.count = next_number(directory, prefix, ".npz")  # Number of the next episode file
+        self._states = []
+        self._actions = []
+        self._rewards = []
+
+    def start(self, env):
+        """Starts an episode from the current state of `env` (after reset()), dropping any unsaved one."""
+        self._states = [env.unwrapped._state.copy()]
+        self._actions = []
+        self._rewards = []
+
+    def record(self, env, action, reward):
+        """Adds the step that played `action` in `env` (after step())."""
+        self._states.append(env.unwrapped._state.copy())
+        self._actions.append(action)
+        self._rewards.append(reward)
+
+    def end(self):
+        """
+        Saves the current episode, if it has any step.
+
+        Returns:
+        - str or None: Path of the episode file.
+        """
+        if not self._actions:
+            return None
+        path = os.path.join(self.directory, f"{self.prefix}-{self.count:05d}.npz")
+        # "xb": fails rather than overwrite an episode saved by another recorder
+        with open(path, "xb") as file:
+            np.savez_compressed(
+                file,
+                states=np.stack(self._states),
+                actions=np.asarray(self._actions, dtype=np.uint8).reshape(-1, 4),
+                rewards=np.asarray(self._rewards, dtype=np.float32),
+            )
+        self.count += 1
+        self._actions = []
+        return path
+
+
+def load_episode(path):
+    """Arrays of an episode file: "states" (steps + 1, 194) uint8, "actions" (steps, 4), "rewards" (steps,)."""
+    with np.load(path) as episode:
+        if episode["states"].shape[1] != STATE_SIZE:
+            raise ValueError(f"{path} does not hold states of {STATE_SIZE} bytes")
+        return {key: episode[key] for key in episode.files}
+
+
+def render_episode(path, mode="rgb_array"):
+    """Yields the render ("ansi" text or "rgb_array" frame) of every state of an episode file."""
+    if mode not in ("ansi", "rgb_array"):
+        raise ValueError(f"Unknown render mode {mode!r}")
+    render = render_ansi if mode == "ansi" else render_rgb
+    for state in load_episode(path)["states"]:
+        yield render(state)
+
+
+def write_video(path, output, fps=4):
+    """
+    Encodes an episode file with cv2: an animated GIF if `output` ends in .gif, otherwise a
+    video (mp4v for .mp4, MJPG for other extensions such as .avi).
+    """
+    frames = [cv2.cvtColor(frame, cv2.COLOR_RGB2BGR) for frame in render_episode(path)]
+    if output.lower().endswith(".gif"):
+        animation = cv2.Animation()
+        animation.frames = frames
+        animation.durations = [int(1000 / fps)] * len(frames)
+        if not cv2.imwriteanimation(output, animation):
+            raise OSError(f"Could not write {output}")
+        return
+    codec = "mp4v" if output.lower().endswith(".mp4") else "MJPG"
+    writer = cv2.VideoWriter(output, cv2.VideoWriter_fourcc(*codec), fps, (FRAME_WIDTH, FRAME_HEIGHT))
+    if not writer.isOpened():
+        raise OSError(f"Could not open a {codec} video writer for {output}")
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Encode recorded episodes as GIFs or videos.")
+    parser.add_argument("episodes", nargs="+", help="episode .npz files written by EpisodeRecorder")
+    parser.add_argument("--format", default="gif", help="output extension: gif, mp4 or avi")
+    parser.add_argument("--fps", type=float, default=4)
+    args = parser.parse_args()
+    for episode in args.episodes:
+        output = f"{os.path.splitext(episode)[0]}.{args.format}"
+        write_video(episode, output, args.fps)
+        print(f"Wrote {output}")
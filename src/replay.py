@@ -0,0 +1,187 @@
+import os
+
+import numpy as np
+
+from env import SolitaireEnv
+from moves import decode_action, encode_action
+from recorder import TrajectoryRecorder
+
+
+# An episode log file is a sequence of episodes, each stored as its number of actions
+# (little-endian uint16), the 52 card ids of the deck it was dealt from, and its actions
+# as flat indices (moves.encode_action, little-endian uint16). Since games are fully
+# determined by their deck, this is enough to replay them exactly: about 850 bytes for a
+# 400-step game.
+COUNT_DTYPE = np.dtype("<u2")
+ACTION_DTYPE = np.dtype("<u2")
+LOG_SUFFIX = ".episodes"
+
+
+class EpisodeLog:
+    """Appends episodes (deck and actions) to an episode log file."""
+
+    def __init__(self, path):
+        """
+        Parameters:
+        - path (str): Log file, appended to if it exists.
+        """
+        self.path = path
+        self._file = open(path, "ab")
+
+    def write(self, deck, actions):
+        """
+        Adds an episode.
+
+        Parameters:
+        - deck (sequence): The 52 card ids the game was dealt from (SolitaireEnv.deck).
+        - actions (sequence): The actions played, as [action_type, source_col, source_idx,
+          destination] or flat indices.
+        """
+        actions = [action if np.isscalar(action) else encode_action(action) for action in actions]
+        if len(actions) > np.iinfo(COUNT_DTYPE).max:
+            raise ValueError(f"Episodes are limited to {np.iinfo(COUNT_DTYPE).max} actions")
+        self._file.write(np.array([len(actions)], dtype=COUNT_DTYPE).tobytes())
+        self._file.write(np.asarray(deck, dtype=np.uint8).tobytes())
+        self._file.write(np.asarray(actions, dtype=ACTION_DTYPE).tobytes())
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_episodes(path):
+    """
+    Yields the episodes of a log file as (deck, actions): uint8 (52,) card ids and uint16
+    flat action indices.
+    """
+    data = np.fromfile(path, dtype=np.uint8)
+    position = 0
+    while position < len(data):
+        count = int(data[position:position + COUNT_DTYPE.itemsize].view(COUNT_DTYPE)[0])
+        position += COUNT_DTYPE.itemsize
+        deck = data[position:position + 52]
+        position += 52
+        actions = data[position:position + count * ACTION_DTYPE.itemsize].view(ACTION_DTYPE)
+        position += count * ACTION_DTYPE.itemsize
+        if len(actions) < count:
+            break  # Cut short while being written
+        yield deck, actions
+
+
+class Replayer:
+    """
+    Rebuilds any step of a logged episode in a SolitaireEnv.
+
+    Steps are played with SolitaireEnv.play, which skips the observation, so reaching a
+    step costs only the moves before it; the observation is built once, for the step that
+    is looked at. Snapshots taken every `checkpoint_every` steps on the way make going back
+    cheap too.
+    """
+
+    def __init__(self, deck, actions, env=None, checkpoint_every=64):
+        """
+        Parameters:
+        - deck (sequence): The 52 card ids the game was dealt from.
+        - actions (sequence): Flat action indices (as read by read_episodes).
+        - env (SolitaireEnv): Env to replay in (a new one-hot env if None), e.g. one with
+          another observation_mode.
+        - checkpoint_every (int): Steps between snapshots.
+        """
+        self.env = SolitaireEnv() if env is None else env
+        self.actions = [decode_action(int(index)) for index in actions]
+        self.checkpoint_every = checkpoint_every
+        self.env.reset(options={"deck": deck})
+        self.step = 0  # Actions played in env
+        self._checkpoints = [self.env.snapshot(history=False)]
+
+    def __len__(self):
+        """Number of actions in the episode."""
+        return len(self.actions)
+
+    def seek(self, step):
+        """
+        Puts the env in the state after the first `step` actions (0 for the deal).
+
+        Returns:
+        - list: Rewards of the actions played to get there from the previous position
+          (empty when going back to a checkpoint first).
+        """
+        if not 0 <= step <= len(self.actions):
+            raise IndexError(f"Step {step} out of range for an episode of {len(self.actions)} actions")
+        if step < self.step:
+            checkpoint = step // self.checkpoint_every
+            self.env.restore(self._checkpoints[checkpoint])
+            self.step = checkpoint * self.checkpoint_every
+        rewards = []
+        while self.step < step:
+            rewards.append(self.env.play(self.actions[self.step]))
+            self._played()
+        return rewards
+
+    def _played(self):
+        # Counts an action just played in env, keeping a snapshot every checkpoint_every steps
+        self.step += 1
+        if not self.step % self.checkpoint_every and len(self._checkpoints) == self.step // self.checkpoint_every:
+            self._checkpoints.append(self.env.snapshot(history=False))
+
+    def observation(self, step):
+        """Observation of the env after the first `step` actions."""
+        self.seek(step)
+        return self.env._get_observation()
+
+    def transitions(self):
+        """
+        Yields (observation, action, reward, done) for every step of the episode from the
+        start, as step() returns them: the observation the action was taken in, and whether
+        the game ended (won or out of tries) with it.
+        """
+        self.seek(0)
+        observation = self.env._get_observation()
+        for action in self.actions:
+            next_observation, reward, terminated, truncated, _ = self.env.step(action)
+            self._played()
+            yield observation, action, reward, terminated or truncated
+            observation = next_observation
+
+
+def regenerate(log_paths, directory, prefix="trajectories", **kwargs):
+    """
+    Rebuilds a trajectory dataset (recorder.TrajectoryRecorder shards, see dataset.py)
+    from episode logs, with the current observation encoding.
+
+    Returns:
+    - int: Number of transitions written.
+    """
+    env = SolitaireEnv()
+    with TrajectoryRecorder(directory, prefix, **kwargs) as recorder:
+        for path in log_paths:
+            for deck, actions in read_episodes(path):
+                for observation, action, reward, done in Replayer(deck, actions, env).transitions():
+                    recorder.record(observation, action, reward, done)
+        return recorder.count
+
+
+def log_paths(directory):
+    """Episode log files in a directory, in order."""
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(LOG_SUFFIX))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Regenerate trajectory shards from episode logs.")
+    parser.add_argument("logs", nargs="+", help=f"episode log files, or directories of *{LOG_SUFFIX} files")
+    parser.add_argument("--output", default="gameplay_data")
+    parser.add_argument("--prefix", default="trajectories")
+    args = parser.parse_args()
+    paths = [path for log in args.logs for path in (log_paths(log) if os.path.isdir(log) else [log])]
+    count = regenerate(paths, args.output, args.prefix)
+    print(f"Wrote {count} transitions to {args.output}")
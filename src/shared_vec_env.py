@@ -0,0 +1,209 @@
+import multiprocessing as mp
+from multiprocessing.connection import wait
+
+import cloudpickle
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+
+from shared_worker import buffer_size, layout, views, worker
+
+
+class SharedMemoryVecEnv(VecEnv):
+    """
+    Stable-Baselines3 VecEnv running every env in its own process, like SubprocVecEnv, but
+    with observations, rewards, dones and action masks written by the workers into arrays
+    in shared memory instead of being pickled through pipes: the pipes only carry the step
+    commands and the (small) info dicts. A one-hot SolitaireEnv observation (6.9 KB) is
+    copied once into shared memory instead of being pickled, sent and unpickled per step.
+
+    Besides the synchronous step(), workers can be stepped asynchronously: send() starts
+    some of them and ready() returns whichever have finished, so a fast policy doesn't wait
+    for the slowest env.
+
+    Wrap the envs like for SubprocVecEnv; with MaskablePPO, env_method("action_masks") (and
+    action_masks()) are answered from shared memory without asking the workers. Create
+    SolitaireEnvs with copy_observations=False in the workers to skip a copy per step.
+
+    Workers run shared_worker.worker, which doesn't import stable_baselines3, so one holding
+    a SolitaireEnv takes about 40 MB instead of 500 MB. With the spawn and forkserver start
+    methods they also import the main script: keep its stable_baselines3 imports (and this
+    module's) inside the `if __name__ == "__main__":` block for that to hold.
+    """
+
+    def __init__(self, env_fns, start_method=None, copy_observations=True):
+        """
+        Parameters:
+        - env_fns (list): Functions creating the envs, one per worker.
+        - start_method (str): multiprocessing start method (forkserver if available,
+          otherwise spawn, as in SubprocVecEnv).
+        - copy_observations (bool): Whether reset(), step() and ready() return copies of
+          the observation arrays. When False they return views of the shared arrays, which
+          the workers overwrite on their next step.
+        """
+        self.copy_observations = copy_observations
+        self.waiting = False
+        self.closed = False
+        num_envs = len(env_fns)
+
+        # The shapes and dtypes of the shared arrays come from an env built here
+        env = env_fns[0]()
+        observation, _ = env.reset()
+        observation_space, action_space = env.observation_space, env.action_space
+        mask_size = env.action_masks().size if hasattr(env, "action_masks") else 0
+        env.close()
+        self._dict_observations = isinstance(observation_space, spaces.Dict)
+        shared_layout = layout(observation, action_space, mask_size)
+
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(start_method)
+        self._buffer = ctx.RawArray("B", buffer_size(shared_layout, num_envs))
+        self._views = views(self._buffer, shared_layout, num_envs)
+        self._keys = [name[1] for name, _, _ in shared_layout if name[0] == "observation"]
+
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(num_envs)])
+        self.processes = []
+        for index, (work_remote, remote, env_fn) in enumerate(zip(self.work_remotes, self.remotes, env_fns)):
+            args = (work_remote, remote, cloudpickle.dumps(env_fn), self._buffer, shared_layout, num_envs, index)
+            process = ctx.Process(target=worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+        self._pending = set()  # Workers stepping
+        self._infos = [{} for _ in range(num_envs)]
+
+        super().__init__(num_envs, observation_space, action_space)
+
+    def _observations(self, indices=None):
+        def select(array):
+            array = array if indices is None else array[indices]
+            return array.copy() if self.copy_observations and indices is None else array
+
+        if self._dict_observations:
+            return {key: select(self._views["observation", key]) for key in self._keys}
+        return select(self._views["observation", None])
+
+    def reset(self):
+        self._wait_all()
+        for index, remote in enumerate(self.remotes):
+            remote.send(("reset", (self._seeds[index], self._options[index])))
+        self.reset_infos = [remote.recv() for remote in self.remotes]
+        self._reset_seeds()
+        self._reset_options()
+        return self._observations()
+
+    def send(self, actions, indices=None):
+        """
+        Starts stepping the given workers (all when None) with their actions, without
+        waiting for them; see ready().
+        """
+        indices = self._get_indices(indices)
+        # Checked before writing: a stepping worker may not have read its action yet
+        for index in indices:
+            if index in self._pending:
+                raise RuntimeError(f"Env {index} is already stepping")
+        self._views["action"][indices] = np.asarray(actions).reshape((len(indices),) + self.action_space.shape)
+        for index in indices:
+            self._pending.add(index)
+            self.remotes[index].send(("step", None))
+
+    def ready(self, indices=None, timeout=None):
+        """
+        Waits until at least one of the given stepping workers (all stepping ones when None)
+        has finished, or for `timeout` seconds.
+
+        Returns:
+        - tuple: (indices, observations, rewards, dones, infos) of the workers that finished,
+          as for step() but only for those envs (indices in increasing order).
+        """
+        waiting = self._pending if indices is None else self._pending & set(indices)
+        finished = []
+        if waiting:
+            ready = set(wait([self.remotes[index] for index in waiting], timeout))
+            finished = sorted(index for index in waiting if self.remotes[index] in ready)
+        for index in finished:
+            info, reset_info = self.remotes[index].recv()
+            if self._views["done"][index]:
+                info["terminal_observation"] = self._final_observation(index)
+            if reset_info is not None:
+                self.reset_infos[index] = reset_info
+            self._infos[index] = info
+            self._pending.discard(index)
+        return (finished, self._observations(finished), self._views["reward"][finished].copy(),
+                self._views["done"][finished].copy(), [self._infos[index] for index in finished])
+
+    def _wait_all(self):
+        # Lets every worker stepping asynchronously finish (their results stay in the shared arrays)
+        while self._pending:
+            self.ready()
+
+    def _final_observation(self, index):
+        if self._dict_observations:
+            return {key: self._views["final_observation", key][index].copy() for key in self._keys}
+        return self._views["final_observation", None][index].copy()
+
+    def step_async(self, actions):
+        self.send(actions)
+        self.waiting = True
+
+    def step_wait(self):
+        self._wait_all()
+        self.waiting = False
+        return (self._observations(), self._views["reward"].copy(), self._views["done"].copy(),
+                list(self._infos))
+
+    def action_masks(self):
+        """Action masks of all envs after their last step or reset, shape (num_envs, mask size)."""
+        return self._views["action_mask"].copy()
+
+    def close(self):
+        if self.closed:
+            return
+        self._wait_all()
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+    def get_images(self):
+        for remote in self.remotes:
+            remote.send(("render", None))
+        return [remote.recv() for remote in self.remotes]
+
+    def get_attr(self, attr_name, indices=None):
+        remotes = self._get_target_remotes(indices)
+        for remote in remotes:
+            remote.send(("get_attr", attr_name))
+        return [remote.recv() for remote in remotes]
+
+    def set_attr(self, attr_name, value, indices=None):
+        remotes = self._get_target_remotes(indices)
+        for remote in remotes:
+            remote.send(("set_attr", (attr_name, value)))
+        for remote in remotes:
+            remote.recv()
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        if method_name == "action_masks" and not method_args and not method_kwargs:
+            return list(self._views["action_mask"][self._get_indices(indices)].copy())
+        remotes = self._get_target_remotes(indices)
+        for remote in remotes:
+            remote.send(("env_method", (method_name, method_args, method_kwargs)))
+        return [remote.recv() for remote in remotes]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        remotes = self._get_target_remotes(indices)
+        for remote in remotes:
+            remote.send(("is_wrapped", wrapper_class))
+        return [remote.recv() for remote in remotes]
+
+    def _get_indices(self, indices):
+        indices = super()._get_indices(indices)
+        return list(range(self.num_envs)) if isinstance(indices, range) else list(indices)
+
+    def _get_target_remotes(self, indices):
+        # Commands other than steps need the workers idle
+        self._wait_all()
+        return [self.remotes[index] for index in self._get_indices(indices)]
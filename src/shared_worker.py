@@ -0,0 +1,116 @@
+import cloudpickle
+import numpy as np
+
+
+# Worker side of shared_vec_env.SharedMemoryVecEnv. It is kept apart from it so worker
+# processes, which import this module to run worker(), don't import stable_baselines3
+# (and torch) with it: a worker only needs the env and numpy.
+
+
+def layout(observation, action_space, mask_size):
+    """
+    (name, shape per env, dtype) of every shared array. Observations are stored with the
+    dtype of the arrays the env returns (uint8 for SolitaireEnv), not of its space; actions
+    with the dtype of the action space, so Box actions aren't truncated.
+    """
+    arrays = []
+    for key, value in (observation.items() if isinstance(observation, dict) else [(None, observation)]):
+        value = np.asarray(value)
+        arrays.append((("observation", key), value.shape, value.dtype))
+        arrays.append((("final_observation", key), value.shape, value.dtype))
+    arrays += [
+        ("action", action_space.shape, action_space.dtype),
+        ("reward", (), np.float32),
+        ("done", (), np.bool_),
+        ("action_mask", (mask_size,), np.bool_),
+    ]
+    return arrays
+
+
+def views(buffer, layout, num_envs):
+    """Numpy arrays of shape (num_envs, ...) over one shared buffer, each aligned to 64 bytes."""
+    arrays = {}
+    offset = 0
+    for name, shape, dtype in layout:
+        dtype = np.dtype(dtype)
+        size = num_envs * int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+        arrays[name] = np.frombuffer(buffer, dtype=dtype, count=size // dtype.itemsize, offset=offset).reshape(
+            (num_envs,) + tuple(shape))
+        offset += -(-size // 64) * 64
+    return arrays
+
+
+def buffer_size(layout, num_envs):
+    """Bytes of the shared buffer holding the arrays of `layout` for `num_envs` envs."""
+    return sum(-(-num_envs * int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize // 64) * 64
+               for _, shape, dtype in layout)
+
+
+def write_observation(arrays, kind, index, observation):
+    if isinstance(observation, dict):
+        for key, value in observation.items():
+            arrays[kind, key][index] = value
+    else:
+        arrays[kind, None][index] = observation
+
+
+def worker(remote, parent_remote, env_fn, buffer, layout, num_envs, index):
+    """
+    Runs one env, stepping it on the commands received through `remote` and writing the
+    results into the shared arrays at `index`.
+
+    Parameters:
+    - env_fn (bytes): The function creating the env, pickled with cloudpickle.
+    """
+    parent_remote.close()
+    env = cloudpickle.loads(env_fn)()
+    arrays = views(buffer, layout, num_envs)
+    # One-element slices, so scalars are written in place
+    action, reward, done, action_mask = (arrays[name][index:index + 1] for name in ("action", "reward", "done", "action_mask"))
+    has_masks = action_mask.size and hasattr(env, "action_masks")
+
+    while True:
+        try:
+            cmd, data = remote.recv()
+            if cmd == "step":
+                observation, step_reward, terminated, truncated, info = env.step(action[0].tolist())
+                reward[0] = step_reward
+                done[0] = terminated or truncated
+                info["TimeLimit.truncated"] = truncated and not terminated
+                reset_info = None
+                if terminated or truncated:
+                    # The final observation stays in shared memory; the main process puts it in info
+                    write_observation(arrays, "final_observation", index, observation)
+                    observation, reset_info = env.reset()
+                write_observation(arrays, "observation", index, observation)
+                if has_masks:
+                    action_mask[0] = env.action_masks()
+                remote.send((info, reset_info))
+            elif cmd == "reset":
+                seed, options = data
+                observation, reset_info = env.reset(seed=seed, **({"options": options} if options else {}))
+                write_observation(arrays, "observation", index, observation)
+                if has_masks:
+                    action_mask[0] = env.action_masks()
+                remote.send(reset_info)
+            elif cmd == "render":
+                remote.send(env.render())
+            elif cmd == "close":
+                env.close()
+                remote.close()
+                break
+            elif cmd == "env_method":
+                method = env.get_wrapper_attr(data[0])
+                remote.send(method(*data[1], **data[2]))
+            elif cmd == "get_attr":
+                remote.send(env.get_wrapper_attr(data))
+            elif cmd == "set_attr":
+                remote.send(setattr(env, data[0], data[1]))
+            elif cmd == "is_wrapped":
+                from stable_baselines3.common.env_util import is_wrapped
+
+                remote.send(is_wrapped(env, data))
+            else:
+                raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+        except (EOFError, KeyboardInterrupt):
+            break
@@ -0,0 +1,266 @@
+import argparse
+import heapq
+import itertools
+import json
+import multiprocessing
+import time
+
+from card import CARD_ID_MASK, VISIBLE_BIT
+from deals import DealPool
+from env import SolitaireEnv
+from moves import (
+    DRAW_ACTION, KINGS, STACK_CANDIDATES, SUITS, VALUES, decode_action, encode_action, legal_move_indices,
+)
+from state import COLUMN_CAPACITY, DRAW_PILE, DRAW_PILE_LEN, FOUNDATION, LENGTHS, MAX_TRIES, REVEALED, REVEALED_LEN
+
+
+FOUNDATION_FROM_DRAW_PILE = encode_action([2, 11, 0, 0])
+TABLEAU_FROM_DRAW_PILE = encode_action([0, 11, 0, 0])  # + destination
+
+
+class Solver:
+    """
+    Best-first search for a winning line of play from the current state of a SolitaireEnv.
+
+    The search plays moves on the env itself (SolitaireEnv.play), so it follows exactly the
+    rules of step(), and a line must be won before the env's tries run out. Recycling the
+    draw pile is only tried while draw_pile_cycles is left, i.e. never into the penalty.
+
+    Positions are expanded in order of a score favouring few face-down cards, many cards on
+    the foundation, a small draw pile and short lines. Every position is expanded at most
+    once: a transposition table of the Zobrist hashes (state.position_hash) of the positions
+    already queued skips the others.
+    """
+
+    # Weights of the position score (lower is expanded first)
+    hidden_weight = 10
+    foundation_weight = -1
+    stock_weight = 0.5
+    move_weight = 0.05
+
+    def __init__(self, max_nodes=200_000, time_limit=None, cache=None):
+        """
+        Parameters:
+        - max_nodes (int): Positions to expand before giving up.
+        - time_limit (float): Seconds to search before giving up (no limit when None).
+        - cache (PositionCache): Known positions: the search stops at the first position
+          with a known winning line, and the lines found are added to it, as are the deals
+          it found no win for (dead ends).
+        """
+        self.max_nodes = max_nodes
+        self.time_limit = time_limit
+        self.cache = cache
+        self.nodes = 0
+        self.status = None  # "solved", "exhausted" (no position left to expand) or "budget"
+
+    def solve(self, env):
+        """
+        Searches for a win from the current state of `env`, which is left as it was.
+
+        Returns:
+        - list or None: Actions ([action_type, source_col, source_idx, destination]) winning
+          the game when played in order with env.step, or None if none was found.
+        """
+        deadline = None if self.time_limit is None else time.monotonic() + self.time_limit
+        start = env.snapshot()
+        # Queue entries: (score, tie-breaker, position, line), where line is a linked list
+        # (moves, previous line) of the move sequences leading to the position
+        order = itertools.count()
+        frontier = [(0, next(order), env.snapshot(history=False), None)]
+        table = {env.position_hash()}
+        self.nodes = 0
+        self.status = "exhausted"
+        solution = None
+        known = None if self.cache is None else self.cache.known_line(env)
+        if known is not None:
+            self.status = "solved"
+            return known
+        try:
+            while frontier and solution is None:
+                if self.nodes >= self.max_nodes or (
+                        deadline is not None and not self.nodes % 256 and time.monotonic() > deadline):
+                    self.status = "budget"
+                    break
+                _, _, position, line = heapq.heappop(frontier)
+                self.nodes += 1
+                env.restore(position)
+                for moves in self._ordered_moves(env._state.tolist(), env.draw_pile_cycles):
+                    for index in moves:
+                        env.play(decode_action(index))
+                    if env.done:
+                        solution = (moves, line)
+                        break
+                    key = env.position_hash()
+                    if self.cache is not None and key not in table and key in self.cache:
+                        known = self.cache.known_line(env)
+                        if known is not None:
+                            solution = (tuple(encode_action(action) for action in known), (moves, line))
+                            break
+                    if env.tries > 0 and key not in table:
+                        table.add(key)
+                        heapq.heappush(frontier, (self._score(env), next(order), env.snapshot(history=False),
+                                                  (moves, line)))
+                    env.restore(position)
+        finally:
+            env.restore(start)
+
+        if solution is None:
+            if self.cache is not None and self.status == "exhausted" and env.tries == MAX_TRIES:
+                # Only from a deal: the search prunes moves and stops at the env's tries, which
+                # the position hash leaves out, so a mid-game position that ran out of them
+                # isn't a dead end for a caller with more tries left
+                self.cache.update(env.position_hash(), dead_end=True)
+            return None
+        self.status = "solved"
+        actions = []
+        while solution is not None:
+            moves, solution = solution
+            actions[:0] = [decode_action(index) for index in moves]
+        if self.cache is not None:
+            self.cache.import_line(env, actions, won=True, visits=0)
+        return actions
+
+    def _score(self, env):
+        state = env._state.tolist()
+        hidden = 0
+        for column, length in enumerate(state[LENGTHS]):
+            base = column * COLUMN_CAPACITY
+            row = 0
+            while row < length and not state[base + row] & VISIBLE_BIT:
+                row += 1
+            hidden += row
+        return (self.hidden_weight * hidden
+                + self.foundation_weight * sum(state[FOUNDATION])
+                + self.stock_weight * (state[DRAW_PILE_LEN] + state[REVEALED_LEN])
+                - self.move_weight * env.tries)
+
+    @staticmethod
+    def _ordered_moves(state, draw_pile_cycles):
+        # Moves worth trying, as sequences of flat action indices, most promising first.
+        # The draw pile is searched with macro moves: drawing until a card that can be
+        # played comes up, then playing it, so the search doesn't branch on every draw.
+        # Moves that can't help are left out: Kings moving between empty columns and
+        # moving part of a face-up run onto an equal parent unless it frees a card for
+        # the foundation.
+        lengths = state[LENGTHS]
+        heights = state[FOUNDATION]
+        tops = [state[column * COLUMN_CAPACITY + length - 1] & CARD_ID_MASK if length else None
+                for column, length in enumerate(lengths)]
+        scored = []
+
+        for index in legal_move_indices(state):
+            action_type, source, row, destination = decode_action(index)
+            if source == 11 or action_type == 1:
+                continue  # Draw pile moves, see below
+            if action_type == 2:
+                card = tops[source]
+                if Solver._safe_to_foundation(card, heights):
+                    return [(index,)]
+                scored.append((3000 - VALUES[card], (index,)))
+            elif source >= 7:
+                scored.append((-1000, (index,)))
+            elif row == 0:
+                # Emptying a column is only useful for another King
+                if lengths[destination]:
+                    scored.append((1000, (index,)))
+            else:
+                below = state[source * COLUMN_CAPACITY + row - 1]
+                if not below & VISIBLE_BIT:
+                    # Reveals a face-down card, preferably in the column with the most of them
+                    scored.append((4000 + row, (index,)))
+                elif heights[SUITS[below & CARD_ID_MASK]] == VALUES[below & CARD_ID_MASK] - 1:
+                    scored.append((500, (index,)))
+
+        # Every card the draw pile can bring up (without a recycle penalty), with the
+        # fewest draws that reveal it
+        pile = [code & CARD_ID_MASK for code in state[DRAW_PILE.start:DRAW_PILE.start + state[DRAW_PILE_LEN]]]
+        revealed = [code & CARD_ID_MASK for code in state[REVEALED.start:REVEALED.start + state[REVEALED_LEN]]]
+        cycles = draw_pile_cycles
+        draws = 0
+        seen = set()
+        while True:
+            if revealed and revealed[-1] not in seen:
+                card = revealed[-1]
+                seen.add(card)
+                drawn = (DRAW_ACTION,) * draws
+                if heights[SUITS[card]] == VALUES[card] - 1:
+                    if not draws and Solver._safe_to_foundation(card, heights):
+                        return [(FOUNDATION_FROM_DRAW_PILE,)]
+                    scored.append((3000 - VALUES[card] - draws, drawn + (FOUNDATION_FROM_DRAW_PILE,)))
+                for destination, top in enumerate(tops):
+                    if card in (KINGS if top is None else STACK_CANDIDATES[top]):
+                        scored.append((2000 - draws, drawn + (TABLEAU_FROM_DRAW_PILE + destination,)))
+            if pile:
+                revealed.append(pile.pop())
+            elif revealed and cycles > 0 and len(seen) < len(revealed):
+                pile = revealed[::-1]
+                revealed = []
+                cycles -= 1
+            else:
+                break
+            draws += 1
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [moves for _, moves in scored]
+
+    @staticmethod
+    def _safe_to_foundation(card, heights):
+        # Safe when both foundations of the other colour are high enough that no tableau
+        # card could still need it as a parent: such moves are played without branching
+        value = VALUES[card]
+        return value <= 2 or value <= min(heights[2:] if SUITS[card] < 2 else heights[:2]) + 1
+
+
+def _init_worker(deal_pool, max_nodes, time_limit):
+    global _worker_env, _worker_solver
+    _worker_env = SolitaireEnv(deal_pool=None if deal_pool is None else DealPool(deal_pool))
+    _worker_solver = Solver(max_nodes=max_nodes, time_limit=time_limit)
+
+
+def _solve_deal(deal):
+    if _worker_env.deal_pool is None:
+        _worker_env.reset(seed=deal)
+    else:
+        _worker_env.reset(options={"deal": deal})
+    actions = _worker_solver.solve(_worker_env)
+    return deal, actions, _worker_solver.status, _worker_solver.nodes
+
+
+def solve_deals(deals, deal_pool=None, processes=None, max_nodes=200_000, time_limit=None, chunksize=4):
+    """
+    Solves many games over a pool of worker processes, yielding results as they finish.
+
+    Parameters:
+    - deals (iterable of int): Seeds for SolitaireEnv.reset(seed=...), or deal numbers when
+      `deal_pool` is given.
+    - deal_pool (str): Path of a DealPool file, opened (memory-mapped) by every worker.
+    - processes (int): Worker processes (os.cpu_count() when None).
+    - max_nodes, time_limit: Search budget per game (see Solver).
+
+    Yields:
+    - tuple: (deal, actions or None, status, nodes searched)
+    """
+    with multiprocessing.Pool(processes, initializer=_init_worker,
+                              initargs=(deal_pool, max_nodes, time_limit)) as pool:
+        yield from pool.imap_unordered(_solve_deal, deals, chunksize)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve seeded deals and save the winning action sequences.")
+    parser.add_argument("--deals", type=int, default=100, help="number of games, seeds (or deal numbers) from --first")
+    parser.add_argument("--first", type=int, default=0)
+    parser.add_argument("--deal-pool", help="DealPool .npy file to deal the games from")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--max-nodes", type=int, default=200_000)
+    parser.add_argument("--time-limit", type=float)
+    parser.add_argument("--output", default="solutions.jsonl")
+    args = parser.parse_args()
+
+    solved = 0
+    with open(args.output, "w") as file:
+        results = solve_deals(range(args.first, args.first + args.deals), args.deal_pool, args.processes,
+                              args.max_nodes, args.time_limit)
+        for deal, actions, status, nodes in results:
+            # One line per game: replaying the actions from the same seed/deal wins it
+            file.write(json.dumps({"deal": deal, "status": status, "nodes": nodes, "actions": actions}) + "\n")
+            solved += actions is not None
+    print(f"Solved {solved} of {args.deals} games")
@@ -0,0 +1,86 @@
+import numpy as np
+
+from card import CARD_ID_MASK, VISIBLE_BIT
+
+
+# Layout of the game state shared by SolitaireEnv and VecSolitaireEnv.
+# Cards are stored as bytes (card id | VISIBLE_BIT, see card.py), piles as fixed-capacity
+# arrays with a length counter and foundations as one height per suit.
+NUM_COLUMNS = 7
+COLUMN_CAPACITY = 19  # 6 face-down cards under a full King..Ace run
+STOCK_CAPACITY = 24  # cards left in the draw pile after the deal
+OBS_ROWS = 18  # rows of each column exposed in the observation
+MAX_TRIES = 400
+DRAW_PILE_CYCLES = 3
+
+# Offsets in the flat uint8 buffer holding one game
+TABLEAU = slice(0, NUM_COLUMNS * COLUMN_CAPACITY)
+LENGTHS = slice(TABLEAU.stop, TABLEAU.stop + NUM_COLUMNS)
+FOUNDATION = slice(LENGTHS.stop, LENGTHS.stop + 4)
+DRAW_PILE = slice(FOUNDATION.stop, FOUNDATION.stop + STOCK_CAPACITY)
+REVEALED = slice(DRAW_PILE.stop, DRAW_PILE.stop + STOCK_CAPACITY)
+DRAW_PILE_LEN = REVEALED.stop
+REVEALED_LEN = REVEALED.stop + 1
+STATE_SIZE = REVEALED.stop + 2
+
+# Lookup tables indexed by card id (0-51)
+CARD_VALUES = np.arange(52) % 13 + 1
+CARD_SUITS = np.arange(52) // 13
+CARD_IS_RED = CARD_SUITS < 2
+# CAN_STACK[a, b]: card a can be put on top of card b in the tableau
+CAN_STACK = (CARD_VALUES[:, None] == CARD_VALUES[None, :] - 1) & (CARD_IS_RED[:, None] != CARD_IS_RED[None, :])
+
+# DEAL_INDEX[col, row]: position in the shuffled deck of the card dealt to (col, row).
+# Cards are popped from the end of the deck, one column at a time; the first
+# STOCK_CAPACITY cards are left in the draw pile.
+DEAL_INDEX = np.zeros((NUM_COLUMNS, COLUMN_CAPACITY), dtype=np.intp)
+for _col in range(NUM_COLUMNS):
+    for _row in range(_col + 1):
+        DEAL_INDEX[_col, _row] = 51 - _col * (_col + 1) // 2 - _row
+
+
+def deal(state, deck):
+    """Deals a shuffled deck (sequence of 52 card ids) into the flat state buffer `state`."""
+    deck = np.asarray(deck, dtype=np.uint8)
+    tableau = state[TABLEAU].reshape(NUM_COLUMNS, COLUMN_CAPACITY)
+    tableau[:] = deck[DEAL_INDEX]
+    # Only the last card of every column is face-up
+    tableau[np.arange(NUM_COLUMNS), np.arange(NUM_COLUMNS)] |= VISIBLE_BIT
+    state[LENGTHS] = np.arange(1, NUM_COLUMNS + 1)
+    state[FOUNDATION] = 0
+    state[DRAW_PILE] = deck[:STOCK_CAPACITY]
+    state[DRAW_PILE_LEN] = STOCK_CAPACITY
+    state[REVEALED_LEN] = 0
+
+
+# Zobrist keys: one random 64-bit key per (buffer offset, byte value) and per number of draw
+# pile cycles left. The seed is fixed so hashes are the same in every process and run.
+_zobrist_rng = np.random.default_rng(0x50117A12E)
+ZOBRIST = _zobrist_rng.integers(0, 1 << 63, size=(STATE_SIZE, 256), dtype=np.uint64)
+ZOBRIST_CYCLES = _zobrist_rng.integers(0, 1 << 63, size=DRAW_PILE_CYCLES + 2, dtype=np.uint64)
+# For every offset: the byte holding the length of its pile, its position in the pile counted
+# from 1 (0 for bytes that are always part of the position) and the bits that count
+_HASH_LENGTH_BYTE = np.zeros(STATE_SIZE, dtype=np.intp)
+_HASH_ROW = np.zeros(STATE_SIZE, dtype=np.uint8)
+_HASH_BITS = np.full(STATE_SIZE, 0xFF, dtype=np.uint8)
+_HASH_LENGTH_BYTE[TABLEAU] = np.repeat(np.arange(LENGTHS.start, LENGTHS.stop), COLUMN_CAPACITY)
+_HASH_ROW[TABLEAU] = np.tile(np.arange(1, COLUMN_CAPACITY + 1), NUM_COLUMNS)
+_HASH_LENGTH_BYTE[DRAW_PILE] = DRAW_PILE_LEN
+_HASH_LENGTH_BYTE[REVEALED] = REVEALED_LEN
+_HASH_ROW[DRAW_PILE] = _HASH_ROW[REVEALED] = np.arange(1, STOCK_CAPACITY + 1)
+_HASH_BITS[DRAW_PILE] = CARD_ID_MASK
+_OFFSETS = np.arange(STATE_SIZE)
+
+
+def position_hash(state, draw_pile_cycles):
+    """
+    Zobrist hash of a game position: the XOR of the keys of every byte of the state buffer
+    and of the number of draw pile cycles left (all negative counts hash alike).
+
+    Only the bytes that are part of the position count, slots past the end of a pile hash
+    as 0, and draw pile cards hash without their visible bit, so equal positions reached by
+    different moves get the same hash.
+    """
+    codes = np.where(_HASH_ROW <= state[_HASH_LENGTH_BYTE], state & _HASH_BITS, 0)
+    key = np.bitwise_xor.reduce(ZOBRIST[_OFFSETS, codes])
+    return int(key ^ ZOBRIST_CYCLES[max(draw_pile_cycles, -1) + 1])
@@ -0,0 +1,70 @@
+import numpy as np
+
+
+PHASES = ("move", "flip", "win_check", "observation")
+
+# Why a move was invalid (SolitaireEnv._move_within_tableau and _move_to_foundation)
+INVALID_REASONS = (
+    "bad_destination",  # Destination column outside the tableau
+    "bad_source",  # Source column or card index without a card there
+    "no_revealed_card",  # Draw pile source without a revealed card
+    "face_down_or_same_column",  # Face-down card, or onto its own column
+    "king_only",  # Other card than a King onto an empty column
+    "does_not_fit",  # Card can't go onto the destination card or foundation
+)
+
+# Outcomes counted over all steps (draws, recycles included, are valid moves)
+COUNTERS = (
+    "valid_moves", "invalid_moves", "draws", "recycles", "penalized_recycles", "flips",
+    "to_foundation", "from_foundation", "wins",
+)
+
+
+class StepStats:
+    """
+    Totals collected by SolitaireEnv and VecSolitaireEnv with collect_stats=True: time
+    spent in every phase of step() (see PHASES), and how many steps had each outcome (see
+    COUNTERS, and INVALID_REASONS for the invalid moves).
+    """
+
+    def __init__(self):
+        self.steps = 0
+        self.time = dict.fromkeys(PHASES, 0.0)
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.invalid = dict.fromkeys(INVALID_REASONS, 0)
+
+    def count_invalid(self, reason_indices):
+        """Counts invalid moves from an array of indices into INVALID_REASONS."""
+        for reason, count in zip(INVALID_REASONS, np.bincount(reason_indices, minlength=len(INVALID_REASONS))):
+            self.invalid[reason] += int(count)
+        self.counts["invalid_moves"] += len(reason_indices)
+
+    def as_dict(self):
+        """The totals as a (JSON-serializable) dict, with "time" in seconds."""
+        return {"steps": self.steps, "time": dict(self.time), "counts": dict(self.counts), "invalid": dict(self.invalid)}
+
+
+def merge_stats(stats):
+    """
+    Sums stats dicts (as returned by get_stats() of several envs, e.g. the sub-environments
+    of a gymnasium vector env) into one. Envs without stats (None) are skipped.
+    """
+    total = StepStats().as_dict()
+    for env_stats in stats:
+        if env_stats is None:
+            continue
+        total["steps"] += env_stats["steps"]
+        for group in ("time", "counts", "invalid"):
+            for key, value in env_stats[group].items():
+                total[group][key] += value
+    return total
+
+
+def vector_stats(envs, reset=False):
+    """
+    Stats of a vector env: VecSolitaireEnv.get_stats(), or the merged stats of the
+    SolitaireEnv sub-environments of a gymnasium SyncVectorEnv/AsyncVectorEnv.
+    """
+    if hasattr(envs, "get_stats"):
+        return envs.get_stats(reset=reset)
+    return merge_stats(envs.call("get_stats", reset=reset))
@@ -0,0 +1,104 @@
+import cv2
+import numpy as np
+
+from card import EMPTY_CARD_ID
+from detector import CardDetector
+from state import NUM_COLUMNS, OBS_ROWS
+
+
+def column_lengths(observation):
+    """Number of cards (face-up or down) in every column of a compact observation."""
+    tableau = np.asarray(observation["tableau"]).reshape(NUM_COLUMNS, OBS_ROWS)
+    return (tableau != EMPTY_CARD_ID).sum(axis=1)
+
+
+def infer_action(before, after):
+    """
+    The SolitaireEnv action that turns one compact observation (see CardDetector.detect or
+    SolitaireEnv(observation_mode="compact")) into the next, in the canonical form of
+    moves.legal_move_indices, or None if no single move explains the change.
+    """
+    lengths_before, lengths_after = column_lengths(before), column_lengths(after)
+    grown = np.flatnonzero(lengths_after > lengths_before)
+    shrunk = np.flatnonzero(lengths_after < lengths_before)
+    foundation_change = np.asarray(after["foundation"], dtype=int) - np.asarray(before["foundation"], dtype=int)
+    top_card_changed = int(after["top_card"][0]) != int(before["top_card"][0])
+
+    if len(grown) == 1:
+        destination = int(grown[0])
+        if len(shrunk) == 1:
+            source = int(shrunk[0])
+            return [0, source, int(lengths_after[source]), destination]
+        if not len(shrunk):
+            removed = np.flatnonzero(foundation_change < 0)
+            if len(removed) == 1:
+                return [0, 7 + int(removed[0]), 0, destination]
+            if top_card_changed:
+                return [0, 11, 0, destination]
+    elif not len(grown):
+        if (foundation_change > 0).sum() == 1:
+            if len(shrunk) == 1:
+                return [2, int(shrunk[0]), 0, 0]
+            if not len(shrunk) and top_card_changed:
+                return [2, 11, 0, 0]
+        elif not len(shrunk) and not foundation_change.any() and top_card_changed:
+            return [1, 0, 0, 0]
+    return None
+
+
+class FrameTracker:
+    """
+    Follows a game from a stream of screenshots.
+
+    The first frame is read completely with a CardDetector. For every next frame, only the
+    card slots whose icon windows changed since the previous frame are detected again, and
+    the draw pile only if its band changed, so an unchanged frame costs one frame difference
+    and a move only the few slots it touched. Frames should be taken when the game is at
+    rest, not in the middle of a card animation.
+    """
+
+    def __init__(self, detector=None, min_changed=20):
+        """
+        Parameters:
+        - detector (CardDetector): Detector to use (a new one with the default icons if None).
+        - min_changed (int): Changed pixels for a slot to be detected again.
+        """
+        self.detector = CardDetector() if detector is None else detector
+        self.min_changed = min_changed
+        self.observation = None  # Compact observation of the last frame
+        self._gray = None
+        self._cards = None
+        self._top_card = None
+
+    def update(self, image):
+        """
+        Reads the next frame (BGR).
+
+        Returns:
+        - tuple: (observation, action), the compact observation of the frame and the action
+          explaining the change from the previous frame (see infer_action), None for the
+          first frame or a frame without a single recognizable move.
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if self._gray is None:
+            self._cards = self.detector.detect_slots(image, gray)
+            self._top_card = self.detector.detect_top_card(image, gray)
+        else:
+            slots, draw_pile_changed = self.detector.changed_slots(gray, self._gray, self.min_changed)
+            if len(slots):
+                self._cards[slots] = self.detector.detect_slots(image, gray, slots)
+            if draw_pile_changed:
+                self._top_card = self.detector.detect_top_card(image, gray)
+        self._gray = gray
+
+        observation = self.detector.observation(self._cards, self._top_card)
+        action = None if self.observation is None else infer_action(self.observation, observation)
+        self.observation = observation
+        return observation, action
+
+
+def track(frames, detector=None, min_changed=20):
+    """Yields (observation, action) for every frame of an iterable of BGR frames (see FrameTracker.update)."""
+    tracker = FrameTracker(detector, min_changed)
+    for frame in frames:
+        yield tracker.update(frame)
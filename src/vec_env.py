@@ -0,0 +1,400 @@
+import time
+
+import gymnasium as gym
+from gymnasium import spaces
+from gymnasium.vector import AutoresetMode, VectorEnv
+from gymnasium.vector.utils import batch_space
+import numpy as np
+
+from card import CARD_ID_MASK, VISIBLE_BIT
+from moves import NUM_ACTIONS, legal_move_mask
+from state import (
+    CAN_STACK, CARD_SUITS, CARD_VALUES, COLUMN_CAPACITY, DEAL_INDEX, DRAW_PILE_CYCLES, MAX_TRIES,
+    NUM_COLUMNS, OBS_ROWS, STOCK_CAPACITY,
+)
+from stats import INVALID_REASONS, PHASES, StepStats
+
+
+REASON = {reason: index for index, reason in enumerate(INVALID_REASONS)}
+
+
+def single_observation_space():
+    """Observation space of one game, identical to SolitaireEnv.observation_space."""
+    return spaces.Dict({
+        'tableau': spaces.MultiDiscrete([2] * 54 * NUM_COLUMNS * OBS_ROWS),
+        'foundation': spaces.MultiDiscrete([14, 14, 14, 14]),
+        'top_card': spaces.MultiDiscrete([2] * 54),
+    })
+
+
+class VecSolitaireEnv(VectorEnv):
+    """
+    Steps `num_envs` Solitaire games at once.
+
+    The games are stored as integer arrays instead of lists of Card objects and every
+    move is applied to the whole batch with array operations. Rules, rewards, termination
+    and truncation are the same as in SolitaireEnv. Finished games are reset in the same
+    step; their last observation is returned in infos["final_obs"]. Observations are kept in
+    preallocated uint8 buffers where only the columns changed by the last step are re-encoded;
+    with copy_observations=False, reset() and step() return read-only views of them.
+
+    State arrays (the batched form of the layout in state.py):
+    - tableau (num_envs, 7, 19) uint8 and lengths (num_envs, 7)
+    - foundation (num_envs, 4): number of cards on each suit's foundation
+    - draw_pile (num_envs, 24) and draw_pile_len (num_envs,): top card is the last one
+    - revealed (num_envs, 24) and revealed_len (num_envs,): top card is the last one
+
+    With collect_stats=True, the phases of every step are timed (for the whole batch) and
+    their outcomes counted as in SolitaireEnv: infos["time"] and infos["invalid_reason"]
+    (None for valid moves) per step, totals in get_stats().
+    """
+
+    metadata = {"autoreset_mode": AutoresetMode.SAME_STEP}
+
+    def __init__(self, num_envs, copy_observations=True, deal_pool=None, collect_stats=False):
+        self.num_envs = num_envs
+        self.copy_observations = copy_observations
+        self.deal_pool = deal_pool
+        self.single_action_space = spaces.MultiDiscrete([3, 12, 18, 7])
+        self.single_observation_space = single_observation_space()
+        self.action_space = batch_space(self.single_action_space, num_envs)
+        self.observation_space = batch_space(self.single_observation_space, num_envs)
+
+        self.tableau = np.zeros((num_envs, NUM_COLUMNS, COLUMN_CAPACITY), dtype=np.uint8)
+        self.lengths = np.zeros((num_envs, NUM_COLUMNS), dtype=np.int16)
+        self.foundation = np.zeros((num_envs, 4), dtype=np.int16)
+        self.draw_pile = np.zeros((num_envs, STOCK_CAPACITY), dtype=np.uint8)
+        self.draw_pile_len = np.zeros(num_envs, dtype=np.int16)
+        self.revealed = np.zeros((num_envs, STOCK_CAPACITY), dtype=np.uint8)
+        self.revealed_len = np.zeros(num_envs, dtype=np.int16)
+        self.draw_pile_cycles = np.zeros(num_envs, dtype=np.int16)
+        self.tries = np.zeros(num_envs, dtype=np.int16)
+        self.reward = np.zeros(num_envs, dtype=np.int64)
+
+        self._obs_tableau = np.zeros((num_envs, NUM_COLUMNS, OBS_ROWS, 54), dtype=np.uint8)
+        self._obs_foundation = np.zeros((num_envs, 4), dtype=np.uint8)
+        self._obs_top_card = np.zeros((num_envs, 54), dtype=np.uint8)
+        self._dirty = np.ones((num_envs, NUM_COLUMNS), dtype=bool)
+        self._observation = {
+            "tableau": self._obs_tableau.reshape(num_envs, -1).view(),
+            "foundation": self._obs_foundation.view(),
+            "top_card": self._obs_top_card.view(),
+        }
+        for value in self._observation.values():
+            value.flags.writeable = False
+
+        self._envs = np.arange(num_envs)
+        self._rows = np.arange(max(COLUMN_CAPACITY, STOCK_CAPACITY))
+        self._np_random, self._np_random_seed = gym.utils.seeding.np_random(None)
+        self.stats = StepStats() if collect_stats else None
+        self._invalid_reasons = np.full(num_envs, None, dtype=object)
+
+    def reset(self, *, seed=None, options=None):
+        """
+        Deals a new game in every sub-environment.
+
+        `seed` seeds the generator used for all shuffles (or deal_pool picks) of this vector env;
+        options={"deals": numbers} deals the given deal_pool games, one per sub-environment.
+        """
+        if seed is not None:
+            self._np_random, self._np_random_seed = gym.utils.seeding.np_random(seed)
+        if options is not None and "deals" in options:
+            if self.deal_pool is None:
+                raise ValueError("Dealing by number requires a deal_pool")
+            self.deal(self._envs, self.deal_pool[np.asarray(options["deals"])])
+        else:
+            self._reset_games(self._envs)
+        return self._get_observation(), {}
+
+    def _reset_games(self, envs):
+        if self.deal_pool is not None:
+            decks = self.deal_pool[self.deal_pool.sample(self._np_random, size=envs.size)]
+        else:
+            # Shuffle one deck per game: argsort of random keys is a uniform permutation
+            decks = np.argsort(self._np_random.random((envs.size, 52)), axis=1).astype(np.uint8)
+        self.deal(envs, decks)
+
+    def deal(self, envs, decks):
+        """Deals the given shuffled decks (arrays of card ids, shape (len(envs), 52)) into `envs`."""
+        decks = np.asarray(decks, dtype=np.uint8)
+        self.tableau[envs] = decks[:, DEAL_INDEX]
+        self.lengths[envs] = np.arange(1, NUM_COLUMNS + 1)
+        # Only the last card of every column is face-up
+        self.tableau[envs[:, None], np.arange(NUM_COLUMNS), np.arange(NUM_COLUMNS)] |= VISIBLE_BIT
+        self.foundation[envs] = 0
+        self.draw_pile[envs] = decks[:, :STOCK_CAPACITY]
+        self.draw_pile_len[envs] = STOCK_CAPACITY
+        self.revealed_len[envs] = 0
+        self.draw_pile_cycles[envs] = DRAW_PILE_CYCLES
+        self.tries[envs] = MAX_TRIES
+        self.reward[envs] = 0
+        self._dirty[envs] = True
+
+    def step(self, actions):
+        stats = self.stats
+        if stats is not None:
+            times = [time.perf_counter()]
+            self._invalid_reasons[:] = None
+        actions = np.asarray(actions, dtype=np.intp).reshape(self.num_envs, 4)
+        action_type, source1, source2, destination = actions.T
+        rewards = np.full(self.num_envs, -1, dtype=np.int64)  # Base penalty for each action
+
+        envs = np.flatnonzero(action_type == 0)  # Move Card within Tableau
+        if envs.size:
+            rewards[envs] += self._move_within_tableau(envs, source1[envs], source2[envs], destination[envs])
+
+        envs = np.flatnonzero(action_type == 1)  # Draw Card from Draw Pile
+        if envs.size:
+            rewards[envs] += self._draw_card(envs)
+
+        envs = np.flatnonzero(action_type == 2)  # Move Card to Foundation
+        if envs.size:
+            rewards[envs] += self._move_to_foundation(envs, source1[envs])
+
+        if stats is not None:
+            times.append(time.perf_counter())
+        flipped = self._flip_visible_cards()
+        rewards += flipped * 1600
+        if stats is not None:
+            times.append(time.perf_counter())
+
+        terminations = (self.foundation == 13).all(axis=1)
+        if stats is not None:
+            times.append(time.perf_counter())
+            counts = stats.counts
+            stats.steps += self.num_envs
+            counts["valid_moves"] += self.num_envs - int((self._invalid_reasons != None).sum())
+            counts["flips"] += int(flipped.sum())
+            counts["wins"] += int(terminations.sum())
+        self.reward += rewards
+        self.tries -= 1
+        truncations = self.tries <= 0
+
+        infos = {}
+        ended = np.flatnonzero(terminations | truncations)
+        if ended.size:
+            self._update_observation()
+            infos["final_obs"] = np.full(self.num_envs, None, dtype=object)
+            for env in ended:
+                infos["final_obs"][env] = {key: value[env].copy() for key, value in self._observation.items()}
+            infos["_final_obs"] = terminations | truncations
+            self._reset_games(ended)
+
+        observation = self._get_observation()
+        if stats is not None:
+            times.append(time.perf_counter())
+            step_time = dict(zip(PHASES, np.diff(times).tolist()))
+            for phase, elapsed in step_time.items():
+                stats.time[phase] += elapsed
+            infos["time"] = step_time
+            infos["invalid_reason"] = self._invalid_reasons.copy()
+        return observation, rewards, terminations, truncations, infos
+
+    def get_stats(self, reset=False):
+        """Totals of all sub-environments, see SolitaireEnv.get_stats."""
+        if self.stats is None:
+            return None
+        totals = self.stats.as_dict()
+        if reset:
+            self.stats = StepStats()
+        return totals
+
+    def _count_invalid(self, envs, invalid, reasons):
+        # Records the reasons (indices into INVALID_REASONS) of the invalid moves among `envs`
+        self.stats.count_invalid(reasons[invalid])
+        self._invalid_reasons[envs[invalid]] = np.asarray(INVALID_REASONS, dtype=object)[reasons[invalid]]
+
+    def action_masks(self):
+        """Exact masks of the legal actions, shape (num_envs, 4536); see SolitaireEnv.action_masks."""
+        has_revealed = self.revealed_len > 0
+        revealed_top = self.revealed[self._envs, np.maximum(self.revealed_len - 1, 0)] & CARD_ID_MASK
+        mask = legal_move_mask(self.tableau, self.lengths, self.foundation, revealed_top, has_revealed)
+        return mask.reshape(self.num_envs, NUM_ACTIONS)
+
+    def _top_cards(self, envs, columns):
+        """Card ids on top of the given (non-empty) columns."""
+        top = np.maximum(self.lengths[envs, columns] - 1, 0)
+        return self.tableau[envs, columns, top] & CARD_ID_MASK
+
+    def _push(self, envs, columns, cards):
+        """Puts single face-up cards on top of the given tableau columns."""
+        self.tableau[envs, columns, self.lengths[envs, columns]] = cards | VISIBLE_BIT
+        self.lengths[envs, columns] += 1
+        self._dirty[envs, columns] = True
+
+    def _move_within_tableau(self, envs, source_col, source_idx, destination):
+        # Rewards mirror SolitaireEnv._move_within_tableau, plus the -10 penalty step() adds
+        # for invalid moves
+        reward = np.full(envs.size, -50, dtype=np.int64)
+        bad_destination = (destination < 0) | (destination > 6)
+        dest = np.clip(destination, 0, 6)
+        dest_empty = self.lengths[envs, dest] == 0
+        dest_card = self._top_cards(envs, dest)
+
+        from_draw_pile = source_col == 11
+        from_foundation = (source_col >= 7) & (source_col <= 10)
+        from_tableau = (source_col >= 0) & (source_col <= 6)
+
+        # Card that would be moved (or moved first, for tableau sequences)
+        col = np.clip(source_col, 0, 6)
+        idx = np.clip(source_idx, 0, COLUMN_CAPACITY - 1)
+        tableau_card = self.tableau[envs, col, idx]
+        revealed_top = np.maximum(self.revealed_len[envs] - 1, 0)
+        suit = np.clip(source_col - 7, 0, 3)
+        height = self.foundation[envs, suit]
+        card = np.select(
+            [from_draw_pile, from_foundation],
+            [self.revealed[envs, revealed_top] & CARD_ID_MASK, np.maximum(suit * 13 + height - 1, 0)],
+            tableau_card & CARD_ID_MASK,
+        )
+        fits = np.where(dest_empty, CARD_VALUES[card] == 13, CAN_STACK[card, dest_card])
+
+        # Draw pile
+        has_revealed = self.revealed_len[envs] > 0
+        reward[from_draw_pile & has_revealed & dest_empty & ~fits] = -60
+        reward[from_draw_pile & has_revealed & fits] = 500
+        # Foundation (never onto an empty column)
+        reward[from_foundation & (height > 0) & ~dest_empty & fits] = 500
+        # Tableau sequence
+        has_card = source_idx < self.lengths[envs, col]
+        reward[from_tableau & ~has_card] = -100
+        movable = from_tableau & has_card & (col != dest) & ((tableau_card & VISIBLE_BIT) != 0)
+        reward[from_tableau & has_card & ~movable] = -40
+        reward[movable & ~fits] = np.where(dest_empty[movable & ~fits], -60, -40)
+        reward[movable & fits] = 500
+        reward[~(from_draw_pile | from_foundation | from_tableau)] = -100
+        reward[bad_destination] = -10
+
+        valid = reward == 500
+        if self.stats is not None:
+            # The first branch of SolitaireEnv._move_within_tableau that rejects the move
+            reasons = np.select(
+                [bad_destination, ~(from_draw_pile | from_foundation | from_tableau),
+                 from_draw_pile & ~has_revealed, from_foundation & (height == 0), from_tableau & ~has_card,
+                 from_tableau & ~movable, ~from_foundation & dest_empty],
+                [REASON["bad_destination"], REASON["bad_source"], REASON["no_revealed_card"], REASON["bad_source"],
+                 REASON["bad_source"], REASON["face_down_or_same_column"], REASON["king_only"]],
+                REASON["does_not_fit"],
+            )
+            self._count_invalid(envs, ~valid, reasons)
+        move = valid & from_draw_pile
+        if move.any():
+            e = envs[move]
+            self._push(e, dest[move], card[move])
+            self.revealed_len[e] -= 1
+        move = valid & from_foundation
+        if move.any():
+            e = envs[move]
+            self._push(e, dest[move], card[move])
+            self.foundation[e, suit[move]] -= 1
+            if self.stats is not None:
+                self.stats.counts["from_foundation"] += e.size
+        move = valid & from_tableau
+        if move.any():
+            e, src, dst, start = envs[move], col[move], dest[move], source_idx[move]
+            count = self.lengths[e, src] - start
+            i, k = np.nonzero(self._rows[None, :COLUMN_CAPACITY] < count[:, None])
+            self.tableau[e[i], dst[i], self.lengths[e, dst][i] + k] = self.tableau[e[i], src[i], start[i] + k]
+            self.lengths[e, dst] += count
+            self.lengths[e, src] = start
+            self._dirty[e, src] = True
+            self._dirty[e, dst] = True
+
+        reward[~valid] -= 10  # Extra penalty for invalid move
+        return reward
+
+    def _draw_card(self, envs):
+        reward = np.full(envs.size, -70, dtype=np.int64)
+
+        has_card = self.draw_pile_len[envs] > 0
+        e = envs[has_card]
+        if e.size:
+            self.draw_pile_len[e] -= 1
+            self.revealed[e, self.revealed_len[e]] = self.draw_pile[e, self.draw_pile_len[e]] | VISIBLE_BIT
+            self.revealed_len[e] += 1
+
+        # Restart the draw pile from the revealed cards, in reverse order
+        e = envs[~has_card]
+        if e.size:
+            count = self.revealed_len[e]
+            i, k = np.nonzero(self._rows[None, :STOCK_CAPACITY] < count[:, None])
+            self.draw_pile[e[i], k] = self.revealed[e[i], count[i] - 1 - k]
+            self.draw_pile_len[e] = count
+            self.revealed_len[e] = 0
+            self.draw_pile_cycles[e] -= 1
+            reward[~has_card] -= 100 * (self.draw_pile_cycles[e] < 0)
+            if self.stats is not None:
+                self.stats.counts["recycles"] += e.size
+                self.stats.counts["penalized_recycles"] += int((self.draw_pile_cycles[e] < 0).sum())
+        if self.stats is not None:
+            self.stats.counts["draws"] += envs.size
+        return reward
+
+    def _move_to_foundation(self, envs, source):
+        reward = np.full(envs.size, -60, dtype=np.int64)
+
+        from_draw_pile = source == 11
+        from_tableau = (source >= 0) & (source <= 6)
+        col = np.clip(source, 0, 6)
+        revealed_top = np.maximum(self.revealed_len[envs] - 1, 0)
+        card = np.where(
+            from_draw_pile,
+            self.revealed[envs, revealed_top] & CARD_ID_MASK,
+            self._top_cards(envs, col),
+        )
+        suit = CARD_SUITS[card]
+        fits = self.foundation[envs, suit] == CARD_VALUES[card] - 1
+
+        has_card = np.where(from_draw_pile, self.revealed_len[envs] > 0, self.lengths[envs, col] > 0)
+        reward[from_draw_pile & ~has_card] = -50
+        source_ok = (from_draw_pile | from_tableau) & has_card
+        reward[source_ok] = np.where(fits[source_ok], 130, -40)
+
+        valid = reward == 130
+        if self.stats is not None:
+            reasons = np.select([from_draw_pile & ~has_card, source_ok],
+                                [REASON["no_revealed_card"], REASON["does_not_fit"]], REASON["bad_source"])
+            self._count_invalid(envs, ~valid, reasons)
+            self.stats.counts["to_foundation"] += int(valid.sum())
+        e = envs[valid]
+        if e.size:
+            self.foundation[e, suit[valid]] += 1
+            move = valid & from_draw_pile
+            self.revealed_len[envs[move]] -= 1
+            move = valid & from_tableau
+            self.lengths[envs[move], col[move]] -= 1
+            self._dirty[envs[move], col[move]] = True
+        return reward
+
+    def _flip_visible_cards(self):
+        top = np.maximum(self.lengths - 1, 0)[..., None]
+        top_cards = np.take_along_axis(self.tableau, top, axis=2)[..., 0]
+        hidden = (self.lengths > 0) & ((top_cards & VISIBLE_BIT) == 0)
+        envs, columns = np.nonzero(hidden)
+        self.tableau[envs, columns, top[envs, columns, 0]] |= VISIBLE_BIT
+        self._dirty[envs, columns] = True
+        return hidden.sum(axis=1)
+
+    def _update_observation(self):
+        # Re-encode the changed columns, exactly like SolitaireEnv._get_observation:
+        # face-up cards at index 53, face-down cards at their id
+        envs, columns = np.nonzero(self._dirty)
+        if envs.size:
+            self._obs_tableau[envs, columns] = 0
+            cards = self.tableau[envs, columns, :OBS_ROWS]
+            index = np.where(cards & VISIBLE_BIT, 53, cards & CARD_ID_MASK)
+            i, rows = np.nonzero(self._rows[:OBS_ROWS] < self.lengths[envs, columns][:, None])
+            self._obs_tableau[envs[i], columns[i], rows, index[i, rows]] = 1
+            self._dirty[:] = False
+
+        self._obs_foundation[:] = self.foundation
+        # Revealed cards are always face-up (53); 52 marks an empty revealed pile
+        has_revealed = self.revealed_len > 0
+        self._obs_top_card[:, 53] = has_revealed
+        self._obs_top_card[:, 52] = ~has_revealed
+
+    def _get_observation(self):
+        self._update_observation()
+        if self.copy_observations:
+            return {key: value.copy() for key, value in self._observation.items()}
+        return self._observation
@@ -0,0 +1,153 @@
+import gymnasium as gym
+from gymnasium import spaces
+
+from moves import NUM_ACTIONS, decode_action
+
+
+class ActionMasks:
+    """Mixin for the wrappers below: action_masks() of the wrapped SolitaireEnv, for MaskablePPO."""
+
+    def action_masks(self):
+        return self.env.unwrapped.action_masks()
+
+
+class FlatActionWrapper(ActionMasks, gym.ActionWrapper):
+    """
+    Exposes SolitaireEnv's MultiDiscrete([3, 12, 18, 7]) actions as Discrete(4536), using the
+    flat indices of moves.encode_action. Together with action_masks() this is the setup
+    sb3-contrib's MaskablePPO expects.
+    """
+
+    def __init__(self, env):
+        super().__init__(env)
+        self.action_space = spaces.Discrete(NUM_ACTIONS)
+
+    def action(self, action):
+        return decode_action(int(action))
+
+
+class RecordingWrapper(ActionMasks, gym.Wrapper):
+    """
+    Records every step of the wrapped env with a recorder.TrajectoryRecorder, as the
+    observation the action was taken in, the action, its reward and whether the game ended.
+
+    Wrap the SolitaireEnv directly (inside FlatActionWrapper) so the recorded actions are
+    [action_type, source_col, source_idx, destination].
+    """
+
+    def __init__(self, env, recorder):
+        super().__init__(env)
+        self.recorder = recorder
+        self._observation = None
+
+    def reset(self, **kwargs):
+        observation, info = self.env.reset(**kwargs)
+        self._observation = observation
+        return observation, info
+
+    def step(self, action):
+        observation, reward, terminated, truncated, info = self.env.step(action)
+        self.recorder.record(self._observation, action, reward, terminated or truncated)
+        self._observation = observation
+        return observation, reward, terminated, truncated, info
+
+
+class EpisodeRecordingWrapper(ActionMasks, gym.Wrapper):
+    """
+    Saves every episode of the wrapped env with a rendering.EpisodeRecorder, to render or
+    encode as a GIF or video afterwards. Episodes are saved when they end, and an
+    unfinished one when the next reset() starts or the wrapper is closed.
+    """
+
+    def __init__(self, env, recorder):
+        super().__init__(env)
+        self.recorder = recorder
+
+    def reset(self, **kwargs):
+        self.recorder.end()
+        observation, info = self.env.reset(**kwargs)
+        self.recorder.start(self.env)
+        return observation, info
+
+    def step(self, action):
+        observation, reward, terminated, truncated, info = self.env.step(action)
+        self.recorder.record(self.env, action, reward)
+        if terminated or truncated:
+            self.recorder.end()
+        return observation, reward, terminated, truncated, info
+
+    def close(self):
+        self.recorder.end()
+        super().close()
+
+
+class EpisodeLogWrapper(ActionMasks, gym.Wrapper):
+    """
+    Writes every finished episode of the wrapped env to a replay.EpisodeLog, as its deck
+    and actions (see replay.Replayer to rebuild it). An unfinished episode is written when
+    the next reset() starts or the wrapper is closed.
+    """
+
+    def __init__(self, env, log):
+        super().__init__(env)
+        self.log = log
+        self._deck = None
+        self._actions = []
+
+    def reset(self, **kwargs):
+        self._write()
+        observation, info = self.env.reset(**kwargs)
+        self._deck = self.env.unwrapped.deck.copy()
+        return observation, info
+
+    def step(self, action):
+        observation, reward, terminated, truncated, info = self.env.step(action)
+        self._actions.append(action)
+        if terminated or truncated:
+            self._write()
+        return observation, reward, terminated, truncated, info
+
+    def close(self):
+        self._write()
+        self.log.flush()
+        super().close()
+
+    def _write(self):
+        if self._actions:
+            self.log.write(self._deck, self._actions)
+            self._actions = []
+
+
+class PositionCacheWrapper(ActionMasks, gym.Wrapper):
+    """
+    Looks up every position the wrapped env reaches in a position_cache.PositionCache, as
+    info["position"] (a Position, or None when unknown), so a policy can play the best known
+    action of a known position right away. With record_visits, the positions of every
+    finished episode are added to the cache as visits (and wins if it was won).
+    """
+
+    def __init__(self, env, cache, record_visits=False):
+        super().__init__(env)
+        self.cache = cache
+        self.record_visits = record_visits
+        self._keys = []
+
+    def reset(self, **kwargs):
+        self._keys = []
+        observation, info = self.env.reset(**kwargs)
+        return observation, self._look_up(info)
+
+    def step(self, action):
+        if self.record_visits:
+            self._keys.append(self.env.unwrapped.position_hash())
+        observation, reward, terminated, truncated, info = self.env.step(action)
+        if (terminated or truncated) and self.record_visits:
+            for key in set(self._keys):  # Once per episode, even if it came back to a position
+                self.cache.update(key, visits=1, wins=int(terminated))
+            self._keys = []
+        return observation, reward, terminated, truncated, self._look_up(info)
+
+    def _look_up(self, info):
+        info = dict(info)
+        info["position"] = self.cache.lookup_env(self.env)
+        return info
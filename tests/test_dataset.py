@@ -0,0 +1,41 @@
+import numpy as np
+
+from dataset import NO_ACTION, TrajectoryDataset
+from env import SolitaireEnv
+from moves import decode_action, encode_action
+from recorder import RECORD_DTYPE, TrajectoryRecorder, shard_paths
+
+
+def test_round_trip(tmp_path):
+    env = SolitaireEnv()
+    observation, _ = env.reset(seed=0)
+    rng = np.random.default_rng(0)
+    transitions = []
+    with TrajectoryRecorder(tmp_path, shard_size=64, flush_every=16) as recorder:
+        for step in range(150):
+            action = decode_action(int(rng.choice(np.flatnonzero(env.action_masks()))))
+            next_observation, reward, terminated, truncated, _ = env.step(action)
+            recorder.record(observation, action, reward, terminated or truncated)
+            transitions.append((observation, action, reward, terminated or truncated))
+            observation = next_observation
+    assert len(shard_paths(tmp_path)) == 3
+
+    dataset = TrajectoryDataset(str(tmp_path), batch_size=32, shuffle=False)
+    assert len(dataset) == len(transitions)
+    batches = list(dataset)
+    state = np.concatenate([batch["state"] for batch in batches])
+    expected = np.stack([np.concatenate([observation["tableau"], observation["foundation"], observation["top_card"]])
+                         for observation, _, _, _ in transitions])
+    assert (state == expected).all()
+    assert np.concatenate([batch["action"] for batch in batches]).tolist() == [
+        encode_action(action) for _, action, _, _ in transitions]
+    assert np.concatenate([batch["reward"] for batch in batches]).tolist() == [reward for _, _, reward, _ in transitions]
+    assert np.concatenate([batch["done"] for batch in batches]).tolist() == [done for _, _, _, done in transitions]
+
+
+def test_actions_outside_action_space_are_flagged():
+    # Shards written before the recorder checked actions may hold mistyped moves
+    records = np.zeros(3, dtype=RECORD_DTYPE)
+    records["action"] = [[1, 0, 0, 0], [0, 3, 25, 2], [2, 1, 0, 0]]
+    assert TrajectoryDataset.decode(records)["action"].tolist() == [
+        encode_action([1, 0, 0, 0]), NO_ACTION, encode_action([2, 1, 0, 0])]
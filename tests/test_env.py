@@ -0,0 +1,28 @@
+from env import SolitaireEnv
+from moves import encode_action
+
+
+def test_move_onto_own_column_is_rejected():
+    env = SolitaireEnv(collect_stats=True)
+    env.reset(seed=0)
+    for column in range(1, 7):
+        state = env._state.copy()
+        # The face-up card of the column (and the face-down one above it) onto its own column
+        for row in (column, column - 1):
+            action = [0, column, row, column]
+            assert not env.action_masks()[encode_action(action)]
+            env.step(action)
+            assert env._step_info["invalid_reason"] == "face_down_or_same_column"
+            assert (env._state == state).all()
+
+
+def test_every_action_type_plays():
+    # Tableau moves from every source used to raise UnboundLocalError
+    env = SolitaireEnv()
+    env.reset(seed=1)
+    start = env.snapshot(history=False)
+    for action_type in range(3):
+        for source_col in range(12):
+            for destination in range(7):
+                env.play([action_type, source_col, 0, destination])
+                env.restore(start)
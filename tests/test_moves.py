@@ -0,0 +1,49 @@
+import numpy as np
+
+from env import SolitaireEnv
+from moves import DRAW_ACTION, NUM_ACTIONS, decode_action, legal_move_indices
+
+
+def canonical(action):
+    # Whether an action is in the form the mask uses (see legal_move_indices): the source
+    # index is ignored for draw pile and foundation sources and for moves to the foundation
+    action_type, source_col, source_idx, destination = action
+    if action_type == 1:
+        return action == [1, 0, 0, 0]
+    if action_type == 2 or source_col >= 7:
+        return source_idx == 0 and (action_type == 0 or destination == 0)
+    return True
+
+
+CANONICAL = [index for index in range(NUM_ACTIONS) if canonical(decode_action(index))]
+NON_CANONICAL = np.setdiff1d(np.arange(NUM_ACTIONS), CANONICAL)
+
+
+def positions(games=10, moves=30, seed=0):
+    # Yields an env in positions reached by random legal moves from several deals
+    env = SolitaireEnv(collect_stats=True)
+    rng = np.random.default_rng(seed)
+    for game in range(games):
+        env.reset(seed=game)
+        for _ in range(moves):
+            yield env
+            env.play(decode_action(int(rng.choice(np.flatnonzero(env.action_masks())))))
+
+
+def test_mask_matches_play():
+    count = 0
+    for env in positions():
+        mask = env.action_masks().copy()
+        assert sorted(legal_move_indices(env._state.tolist())) == np.flatnonzero(mask).tolist()
+        assert not mask[NON_CANONICAL].any()
+        start, state = env.snapshot(history=False), env._state.copy()
+        for index in CANONICAL:
+            env.play(decode_action(index))
+            valid = env._step_info["invalid_reason"] is None
+            assert valid == mask[index], (count, decode_action(index))
+            if valid and index != DRAW_ACTION:
+                assert not (env._state == state).all(), (count, decode_action(index))
+            env.restore(start)
+        count += 1
+    assert count == 300
+
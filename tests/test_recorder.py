@@ -0,0 +1,69 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from env import SolitaireEnv
+from recorder import RECORD_DTYPE, TrajectoryRecorder, convert_json, shard_paths
+
+
+def records(directory):
+    return np.concatenate([np.fromfile(path, dtype=RECORD_DTYPE) for path in shard_paths(directory)])
+
+
+def test_rejects_actions_outside_action_space(tmp_path):
+    env = SolitaireEnv()
+    observation, _ = env.reset(seed=0)
+    with TrajectoryRecorder(tmp_path) as recorder:
+        for action in ([2, -1, 0, 0], [0, 3, 25, 2], [0, 1, 2, 3, 4], [3, 0, 0, 0]):
+            with pytest.raises(ValueError):
+                recorder.record(observation, action, -1.0, False)
+        recorder.record(observation, [1, 0, 0, 0], -71.0, False)
+    assert records(tmp_path)["action"].tolist() == [[1, 0, 0, 0]]
+
+
+def test_record_and_pop_after_close(tmp_path):
+    env = SolitaireEnv()
+    observation, _ = env.reset(seed=0)
+    recorder = TrajectoryRecorder(tmp_path, shard_size=8, flush_every=2)
+    for source in range(3):
+        recorder.record(observation, [0, source, 0, 0], -1.0, False)
+    recorder.close()
+    recorder.record(observation, [0, 3, 0, 0], -1.0, False)
+    recorder.close()
+    recorder.pop()
+    recorder.close()
+    recorder.record(observation, [0, 4, 0, 0], -1.0, True)
+    recorder.close()
+    assert len(shard_paths(tmp_path)) == 1
+    assert records(tmp_path)["action"][:, 1].tolist() == [0, 1, 2, 4]
+    assert recorder.count == 4
+
+
+def test_shards_are_numbered_after_the_highest(tmp_path):
+    env = SolitaireEnv()
+    observation, _ = env.reset(seed=0)
+    with TrajectoryRecorder(tmp_path, shard_size=2) as recorder:
+        for _ in range(6):
+            recorder.record(observation, [1, 0, 0, 0], -71.0, False)
+    first, _, last = shard_paths(tmp_path)
+    os.remove(first)
+    written = open(last, "rb").read()
+    with TrajectoryRecorder(tmp_path, shard_size=2) as recorder:
+        recorder.record(observation, [1, 0, 0, 0], -71.0, False)
+    assert open(last, "rb").read() == written
+    assert os.path.basename(shard_paths(tmp_path)[-1]) == "trajectories-00003.bin"
+
+
+def test_convert_json_skips_mistyped_actions(tmp_path):
+    env = SolitaireEnv()
+    observation, _ = env.reset(seed=0)
+    state = {key: value.tolist() for key, value in observation.items()}
+    path = tmp_path / "gameplay_data.json"
+    actions = [[1, 0, 0, 0], [0, 3, 25, 2], [2, 1, 0, 0], [2, -1, 0, 0]]
+    path.write_text(json.dumps([{"state": state, "action": action} for action in actions]))
+    assert convert_json([str(path)], tmp_path / "shards") == 2
+    converted = records(tmp_path / "shards")
+    assert converted["action"].tolist() == [[1, 0, 0, 0], [2, 1, 0, 0]]
+    assert converted["done"].tolist() == [False, True]
@@ -0,0 +1,66 @@
+import numpy as np
+
+from env import SolitaireEnv
+from moves import decode_action
+from state import MAX_TRIES
+
+
+def game_state(env):
+    return env._state.tobytes(), env.draw_pile_cycles, env.tries, env.reward, env.done
+
+
+def play_game(env, rng):
+    # Plays a whole game of mixed moves, returning the game state before every step and at the end
+    states = [game_state(env)]
+    for _ in range(MAX_TRIES):
+        if rng.random() < 0.8:
+            action = decode_action(int(rng.choice(np.flatnonzero(env.action_masks()))))
+        else:
+            action = env.action_space.sample().tolist()
+        env.step(action)
+        states.append(game_state(env))
+    return states
+
+
+def test_undo_redo_restore_exact_states():
+    env = SolitaireEnv(keep_history=True)
+    env.reset(seed=3)
+    env.action_space.seed(3)
+    states = play_game(env, np.random.default_rng(3))
+
+    for expected in reversed(states[:-1]):
+        assert env.undo()
+        assert game_state(env) == expected
+    assert not env.undo()
+    for expected in states[1:]:
+        assert env.redo()
+        assert game_state(env) == expected
+    assert not env.redo()
+
+    # The observation is rebuilt from the restored state
+    observation = env._get_observation()
+    replayed = SolitaireEnv()
+    replayed.restore(env.snapshot())
+    for key, value in replayed._get_observation().items():
+        assert (value == observation[key]).all()
+
+
+def test_snapshot_restore():
+    env = SolitaireEnv(keep_history=True)
+    env.reset(seed=4)
+    env.action_space.seed(4)
+    rng = np.random.default_rng(4)
+    play_game(env, rng)
+    snapshot, expected = env.snapshot(), game_state(env)
+    env.reset(seed=5)
+    env.restore(snapshot)
+    assert game_state(env) == expected
+    assert env.undo()
+
+
+def test_no_history_by_default():
+    env = SolitaireEnv()
+    env.reset(seed=0)
+    env.step([1, 0, 0, 0])
+    assert not env.undo()
+    assert env._history == [] and env._delta == []
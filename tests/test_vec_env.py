@@ -0,0 +1,50 @@
+import numpy as np
+
+from deals import DealPool
+from env import SolitaireEnv
+from moves import decode_action
+from stats import merge_stats
+from vec_env import VecSolitaireEnv
+
+
+NUM_ENVS = 10
+STEPS = 300  # Per game, below MAX_TRIES so no game is auto-reset
+
+
+def mixed_actions(masks, rng):
+    # A legal move for most games and a random (mostly invalid) action for the others
+    actions = []
+    for mask in masks:
+        if rng.random() < 0.7:
+            actions.append(decode_action(int(rng.choice(np.flatnonzero(mask)))))
+        else:
+            actions.append([int(rng.integers(3)), int(rng.integers(12)), int(rng.integers(18)), int(rng.integers(7))])
+    return np.array(actions)
+
+
+def test_matches_single_envs():
+    pool = DealPool(np.stack([np.random.default_rng(deal).permutation(52).astype(np.uint8) for deal in range(NUM_ENVS)]))
+    vec = VecSolitaireEnv(NUM_ENVS, deal_pool=pool, collect_stats=True)
+    envs = [SolitaireEnv(deal_pool=pool, collect_stats=True) for _ in range(NUM_ENVS)]
+    vec_observation, _ = vec.reset(options={"deals": list(range(NUM_ENVS))})
+    observations = [env.reset(options={"deal": deal})[0] for deal, env in enumerate(envs)]
+    rng = np.random.default_rng(0)
+
+    for step in range(STEPS):
+        for key, value in vec_observation.items():
+            assert (value == np.stack([observation[key] for observation in observations])).all(), (step, key)
+        masks = vec.action_masks()
+        assert (masks == np.stack([env.action_masks() for env in envs])).all(), step
+
+        actions = mixed_actions(masks, rng)
+        vec_observation, rewards, terminated, truncated, _ = vec.step(actions)
+        results = [env.step(action.tolist()) for env, action in zip(envs, actions)]
+        observations = [result[0] for result in results]
+        assert rewards.tolist() == [result[1] for result in results], step
+        assert terminated.tolist() == [result[2] for result in results], step
+        assert truncated.tolist() == [result[3] for result in results], step
+
+    vec_stats, single_stats = vec.get_stats(), merge_stats(env.get_stats() for env in envs)
+    assert vec_stats["steps"] == single_stats["steps"] == NUM_ENVS * STEPS
+    assert vec_stats["counts"] == single_stats["counts"]
+    assert vec_stats["invalid"] == single_stats["invalid"]